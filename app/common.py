@@ -0,0 +1,143 @@
+# Name: common
+# Coder: Marco Janssen (mastodon @marc0janssen@mastodon.online)
+# date: 2026-10-15 21:00:00
+# update: 2026-10-15 21:00:00
+
+import imaplib
+import smtplib
+import socket
+import subprocess
+
+from email.header import decode_header
+from chump import Application
+
+
+def magic_packet(mac):
+    # 6 bytes of 0xff followed by the MAC address 16 times
+    address = mac.strip().replace(":", "").replace("-", "").replace(".", "")
+    if len(address) != 12:
+        raise ValueError(f"Incorrect MAC address format: {mac}")
+    return b"\xff" * 6 + bytes.fromhex(address) * 16
+
+
+def send_wol(*packets):
+    # Send the magic packets over one broadcast socket, to the same
+    # address and port wakeonlan uses
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        for packet in packets:
+            sock.sendto(packet, ("255.255.255.255", 9))
+
+
+def is_port_open(ip_address, port, timeout=2.0):
+    # Give up after a few seconds instead of the kernel SYN timeout
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect((ip_address, port))
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def active_ips(ip_addresses):
+    # Start all pings at once and only then wait for every reply
+    pings = {
+        ip_address: subprocess.Popen(
+            ['ping', '-c', '1', '-W', '1', '-q', ip_address],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL)
+        for ip_address in ip_addresses
+    }
+
+    return {
+        ip_address for ip_address, ping in pings.items()
+        if ping.wait() == 0
+    }
+
+
+def header_part(value, index):
+    # One decoded part of a header. Plain headers are used as they are,
+    # encoded words (=?...?=) and raw 8-bit headers, which compat32
+    # returns as a Header, go through decode_header.
+    if value is None:
+        return ""
+    if isinstance(value, str) and "=?" not in value:
+        return value
+
+    part, encoding = decode_header(value)[index]
+    if isinstance(part, bytes):
+        # raw 8-bit headers carry no charset, read them as utf-8
+        if not encoding or encoding == "unknown-8bit":
+            encoding = "utf-8"
+        try:
+            part = part.decode(encoding, errors="replace")
+        except LookupError:
+            part = part.decode("utf-8", errors="replace")
+    return part
+
+
+def search_subject(imap, keyword):
+    # Message numbers of the mails with keyword in their subject. An
+    # ASCII keyword is sent quoted, any other keyword as a UTF-8 literal
+    # since imaplib sends str arguments as ASCII. A server without UTF-8
+    # search returns every mail, the caller compares the subject anyway.
+    if keyword.isascii():
+        quoted = keyword.replace('\\', '\\\\').replace('"', '\\"')
+        status, data = imap.search(None, "SUBJECT", f'"{quoted}"')
+    else:
+        imap.literal = keyword.encode()
+        try:
+            status, data = imap.search("UTF-8", "SUBJECT")
+        except imaplib.IMAP4.error:
+            status = "BAD"
+        if status != "OK":
+            status, data = imap.search(None, "ALL")
+
+    return data[0].split()
+
+
+def pushover_user(token_api, user_key):
+    # The Pushover user the notifications go to
+    return Application(token_api).get_user(user_key)
+
+
+def send_pushover(user, lines, sound, limit=1024):
+    # Send the lines as few Pushover messages as possible, each at most
+    # limit characters, the most Pushover accepts. A longer line is cut.
+    message = None
+    text = ""
+    for line in lines:
+        line = line[:limit - 1] + "\n"
+        if len(text) + len(line) > limit:
+            message = user.send_message(message=text, sound=sound)
+            text = ""
+        text += line
+
+    if text:
+        message = user.send_message(message=text, sound=sound)
+
+    return message
+
+
+def smtp_login(server, port, login, password):
+    # Open a TLS session and log in, a failed login closes it again
+    smtp = smtplib.SMTP(server, port)
+    try:
+        smtp.starttls()
+        smtp.login(login, password)
+    except (smtplib.SMTPException, OSError):
+        smtp.close()
+        raise
+
+    return smtp
+
+
+def smtp_quit(smtp):
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, OSError):
+        # the server already dropped the session
+        smtp.close()
@@ -0,0 +1,95 @@
+# Name: imapidle
+# Coder: Marco Janssen (mastodon @marc0janssen@mastodon.online)
+# date: 2026-10-15 20:00:00
+# update: 2026-10-15 20:00:00
+
+import imaplib
+import logging
+import socket
+import time
+
+# RFC 2177, renew IDLE before the server's 30 minute limit
+IDLE_TIMEOUT = 29 * 60
+
+# seconds to wait before each reconnect, the last failure is raised
+RETRY_DELAYS = (10, 30, 60, 120, 300)
+
+
+def idle(name, connect, process_inbox, logfile=None):
+    # Keep one IMAP connection open and handle new mail as it arrives
+    imap = connect()
+
+    while True:
+        try:
+            process_inbox(imap)
+
+            # write out the log before waiting for the next mail
+            if logfile is not None:
+                logfile.flush()
+
+            wait_for_mail(imap)
+
+        except (imaplib.IMAP4.error, OSError) as e:
+            logging.error(
+                f"{name} - Lost the IMAP connection ({e}), reconnecting.")
+            try:
+                imap.shutdown()
+            except OSError:
+                pass
+            imap = reconnect(name, connect)
+
+
+def reconnect(name, connect):
+    for delay in RETRY_DELAYS:
+        time.sleep(delay)
+        try:
+            return connect()
+        except (imaplib.IMAP4.error, OSError) as e:
+            logging.error(f"{name} - Reconnect failed: {e}")
+
+    return connect()
+
+
+def wait_for_mail(imap, timeout=IDLE_TIMEOUT):
+    # Park the connection in IMAP IDLE until the server reports new
+    # mail or the timeout passes. All lines go through imaplib's own
+    # reader, so nothing it already buffered is skipped.
+    tag = imap._new_tag()
+    imap.send(tag + b" IDLE\r\n")
+
+    # the server answers with a continuation, or refuses with the tag
+    while True:
+        line = read_line(imap)
+        if line.startswith(b"+"):
+            break
+        if line.startswith(tag + b" "):
+            raise imaplib.IMAP4.error(f"IDLE failed: {line.strip()}")
+
+    previous = imap.sock.gettimeout()
+    imap.sock.settimeout(timeout)
+    try:
+        while True:
+            line = read_line(imap)
+            if line.startswith(b"*") and line.rstrip().endswith(b"EXISTS"):
+                break
+    except socket.timeout:
+        # a reader that timed out refuses to read again, the server sent
+        # nothing in the meantime so a fresh one loses no data
+        imap.file = imap.sock.makefile('rb')
+    finally:
+        imap.sock.settimeout(previous)
+
+    imap.send(b"DONE\r\n")
+    while True:
+        line = read_line(imap)
+        if line.startswith(tag + b" "):
+            if not line.startswith(tag + b" OK"):
+                raise imaplib.IMAP4.error(f"IDLE failed: {line.strip()}")
+            return
+
+
+def read_line(imap):
+    line = imap.readline()
+    if not line:
+        raise imaplib.IMAP4.abort("Connection closed during IDLE.")
+    return line
@@ -33,64 +33,8 @@ class POWEROFF():
         self.config_filePath = f"{config_dir}{self.config_file}"
         self.log_filePath = f"{log_dir}{self.log_file}"
 
-        try:
-            with open(self.config_filePath, "r") as f:
-                f.close()
-            try:
-                self.config = configparser.ConfigParser()
-                self.config.read(self.config_filePath)
-
-                # GENERAL
-                self.enabled = True if (
-                    self.config['GENERAL']['ENABLED'] == "ON") else False
-                self.dry_run = True if (
-                    self.config['GENERAL']['DRY_RUN'] == "ON") else False
-                self.verbose_logging = True if (
-                    self.config['GENERAL']['VERBOSE_LOGGING'] == "ON") \
-                    else False
-
-                # NODE
-                self.nodename = self.config['NODE']['NODE_NAME']
-                self.nodeip = self.config['NODE']['NODE_IP']
-                self.nodeport = int(self.config['NODE']['NODE_PORT'])
-                self.nodesshport = int(self.config['NODE']['NODE_SSHPORT'])
-                self.nodeuser = self.config['NODE']['NODE_USER']
-                self.nodepwd = self.config['NODE']['NODE_PWD']
-
-                # POWEROFF
-                self.poweroffcommand = \
-                    self.config['POWEROFF']['POWEROFFCOMMAND']
-
-                # EXTENDTIME
-                self.defaulthour = self.config['EXTENDTIME']['DEFAULT_HOUR']
-                self.defaultminutes = \
-                    self.config['EXTENDTIME']['DEFAULT_MINUTES']
-                self.maxhour = \
-                    self.config['EXTENDTIME']['MAX_SHUTDOWN_HOUR_TIME']
-
-                # PUSHOVER
-                self.pushover_user_key = self.config['PUSHOVER']['USER_KEY']
-                self.pushover_token_api = self.config['PUSHOVER']['TOKEN_API']
-                self.pushover_sound = self.config['PUSHOVER']['SOUND']
-
-            except KeyError as e:
-                logging.error(
-                    f"Seems a key(s) {e} is missing from INI file. "
-                    f"Please check for mistakes. Exiting."
-                )
-
-                sys.exit()
-
-            except ValueError as e:
-                logging.error(
-                    f"Seems a invalid value in INI file. "
-                    f"Please check for mistakes. Exiting. "
-                    f"MSG: {e}"
-                )
-
-                sys.exit()
-
-        except IOError or FileNotFoundError:
+        self.config = configparser.ConfigParser()
+        if not self.config.read(self.config_filePath):
             logging.error(
                 f"Can't open file {self.config_filePath}"
                 f", creating example INI file."
@@ -100,6 +44,57 @@ class POWEROFF():
                             f'{config_dir}{self.exampleconfigfile}')
             sys.exit()
 
+        try:
+            # GENERAL
+            self.enabled = True if (
+                self.config['GENERAL']['ENABLED'] == "ON") else False
+            self.dry_run = True if (
+                self.config['GENERAL']['DRY_RUN'] == "ON") else False
+            self.verbose_logging = True if (
+                self.config['GENERAL']['VERBOSE_LOGGING'] == "ON") \
+                else False
+
+            # NODE
+            self.nodename = self.config['NODE']['NODE_NAME']
+            self.nodeip = self.config['NODE']['NODE_IP']
+            self.nodeport = int(self.config['NODE']['NODE_PORT'])
+            self.nodesshport = int(self.config['NODE']['NODE_SSHPORT'])
+            self.nodeuser = self.config['NODE']['NODE_USER']
+            self.nodepwd = self.config['NODE']['NODE_PWD']
+
+            # POWEROFF
+            self.poweroffcommand = \
+                self.config['POWEROFF']['POWEROFFCOMMAND']
+
+            # EXTENDTIME
+            self.defaulthour = self.config['EXTENDTIME']['DEFAULT_HOUR']
+            self.defaultminutes = \
+                self.config['EXTENDTIME']['DEFAULT_MINUTES']
+            self.maxhour = \
+                self.config['EXTENDTIME']['MAX_SHUTDOWN_HOUR_TIME']
+
+            # PUSHOVER
+            self.pushover_user_key = self.config['PUSHOVER']['USER_KEY']
+            self.pushover_token_api = self.config['PUSHOVER']['TOKEN_API']
+            self.pushover_sound = self.config['PUSHOVER']['SOUND']
+
+        except KeyError as e:
+            logging.error(
+                f"Seems a key(s) {e} is missing from INI file. "
+                f"Please check for mistakes. Exiting."
+            )
+
+            sys.exit()
+
+        except ValueError as e:
+            logging.error(
+                f"Seems a invalid value in INI file. "
+                f"Please check for mistakes. Exiting. "
+                f"MSG: {e}"
+            )
+
+            sys.exit()
+
     def writeLog(self, init, msg):
         try:
             if init:
@@ -3,15 +3,16 @@
 # date: 2023-12-29 14:07:00
 # update: 2023-12-29 14:07:00
 
+import atexit
+import functools
 import logging
 import sys
 import configparser
 import shutil
-import socket
 import subprocess
 
 from datetime import datetime
-from chump import Application
+import common
 
 
 class EXTRA_NODES():
@@ -32,71 +33,8 @@ class EXTRA_NODES():
         self.config_filePath = f"{config_dir}{self.config_file}"
         self.log_filePath = f"{log_dir}{self.log_file}"
 
-        try:
-            with open(self.config_filePath, "r") as f:
-                f.close()
-            try:
-                self.config = configparser.ConfigParser()
-                self.config.read(self.config_filePath)
-
-                # GENERAL
-                self.enabled = True if (
-                    self.config['GENERAL']['ENABLED'] == "ON") else False
-                self.dry_run = True if (
-                    self.config['GENERAL']['DRY_RUN'] == "ON") else False
-                self.verbose_logging = True if (
-                    self.config['GENERAL']['VERBOSE_LOGGING'] == "ON") \
-                    else False
-
-                # NODE
-                self.nodeip = self.config['NODE']['NODE_IP']
-                self.nodeport = int(self.config['NODE']['NODE_PORT'])
-
-                # EXTRANODES
-                self.nodename = list(
-                    self.config['EXTRANODES']
-                    ['NODE_NAME'].split(","))
-                self.nodepwd = list(
-                    self.config['EXTRANODES']
-                    ['NODE_PWD'].split(","))
-                self.nodeuser = list(
-                    self.config['EXTRANODES']
-                    ['NODE_USER'].split(","))
-                self.extranodeip = list(
-                    self.config['EXTRANODES']
-                    ['NODE_IP'].split(","))
-                self.extranodesshport = list(
-                    self.config['EXTRANODES']
-                    ['NODE_SSHPORT'].split(","))
-                self.nodemacaddress = list(
-                    self.config['EXTRANODES']
-                    ['NODE_MAC_ADDRESS'].split(","))
-                self.poweroffcommand = \
-                    self.config['EXTRANODES']['POWEROFFCOMMAND']
-
-                # PUSHOVER
-                self.pushover_user_key = self.config['PUSHOVER']['USER_KEY']
-                self.pushover_token_api = self.config['PUSHOVER']['TOKEN_API']
-                self.pushover_sound = self.config['PUSHOVER']['SOUND']
-
-            except KeyError as e:
-                logging.error(
-                    f"Seems a key(s) {e} is missing from INI file. "
-                    f"Please check for mistakes. Exiting."
-                )
-
-                sys.exit()
-
-            except ValueError as e:
-                logging.error(
-                    f"Seems a invalid value in INI file. "
-                    f"Please check for mistakes. Exiting. "
-                    f"MSG: {e}"
-                )
-
-                sys.exit()
-
-        except IOError or FileNotFoundError:
+        self.config = configparser.ConfigParser()
+        if not self.config.read(self.config_filePath):
             logging.error(
                 f"Can't open file {self.config_filePath}"
                 f", creating example INI file."
@@ -106,31 +44,97 @@ class EXTRA_NODES():
                             f'{config_dir}{self.exampleconfigfile}')
             sys.exit()
 
+        try:
+            # GENERAL
+            self.enabled = True if (
+                self.config['GENERAL']['ENABLED'] == "ON") else False
+            self.dry_run = True if (
+                self.config['GENERAL']['DRY_RUN'] == "ON") else False
+            self.verbose_logging = True if (
+                self.config['GENERAL']['VERBOSE_LOGGING'] == "ON") \
+                else False
+
+            # Look up every section once, the keys are read from these
+            node = self.config['NODE']
+            extranodes = self.config['EXTRANODES']
+            pushover = self.config['PUSHOVER']
+
+            # NODE
+            self.nodeip = node['NODE_IP']
+            self.nodeport = int(node['NODE_PORT'])
+
+            # EXTRANODES, one entry per node, fixed after loading.
+            # Passwords are kept exactly as written.
+            self.nodename = tuple(
+                name.strip()
+                for name in extranodes['NODE_NAME'].split(","))
+            self.nodepwd = tuple(extranodes['NODE_PWD'].split(","))
+            self.nodeuser = tuple(
+                user.strip()
+                for user in extranodes['NODE_USER'].split(","))
+            self.extranodeip = tuple(
+                ip.strip() for ip in extranodes['NODE_IP'].split(","))
+            self.extranodesshport = tuple(
+                port.strip()
+                for port in extranodes['NODE_SSHPORT'].split(","))
+            self.nodemacaddress = tuple(
+                mac.strip()
+                for mac in extranodes['NODE_MAC_ADDRESS'].split(","))
+            self.poweroffcommand = extranodes['POWEROFFCOMMAND']
+
+            # PUSHOVER
+            self.pushover_user_key = pushover['USER_KEY']
+            self.pushover_token_api = pushover['TOKEN_API']
+            self.pushover_sound = pushover['SOUND']
+
+        except KeyError as e:
+            logging.error(
+                f"Seems a key(s) {e} is missing from INI file. "
+                f"Please check for mistakes. Exiting."
+            )
+
+            sys.exit()
+
+        except ValueError as e:
+            logging.error(
+                f"Seems a invalid value in INI file. "
+                f"Please check for mistakes. Exiting. "
+                f"MSG: {e}"
+            )
+
+            sys.exit()
+
+        # Keep the log open for the whole run, line buffered
+        try:
+            self.logfile = open(self.log_filePath, "a", buffering=1)
+            atexit.register(self.logfile.close)
+        except IOError:
+            self.logfile = None
+            logging.error(
+                f"Can't write file {self.log_filePath}."
+            )
+
     def writeLog(self, init, msg):
+        if self.logfile is None:
+            return
         try:
             if init:
-                logfile = open(self.log_filePath, "w")
-            else:
-                logfile = open(self.log_filePath, "a")
-            logfile.write(f"{datetime.now()} - {msg}")
-            logfile.close()
+                self.logfile.truncate(0)
+            self.logfile.write(f"{datetime.now()} - {msg}")
         except IOError:
             logging.error(
                 f"Can't write file {self.log_filePath}."
             )
 
-    def is_active_ip(self, ip_address):
-        command = ['ping', '-c', '1', ip_address]
-        try:
-            _ = subprocess.check_output(command)
-            return True
-        except subprocess.CalledProcessError:
-            return False
+    @functools.cached_property
+    def userPushover(self):
+        # Setting for PushOver, only once a message is actually sent
+        return common.pushover_user(
+            self.pushover_token_api, self.pushover_user_key)
 
     def run(self):
-        # Setting for PushOver
-        self.appPushover = Application(self.pushover_token_api)
-        self.userPushover = self.appPushover.get_user(self.pushover_user_key)
+        if not self.enabled:
+            return
 
         if self.dry_run:
             logging.info(
@@ -145,68 +149,76 @@ class EXTRA_NODES():
                 "PowerOff - Dry run.\n"
             )
 
-        if self.enabled:
-            sock = socket.socket(
-                socket.AF_INET, socket.SOCK_STREAM)
-            result = sock.connect_ex(
-                (self.nodeip, self.nodeport))
-            # Port is open of the master node
-
-            if result != 0:
-                if not self.dry_run:
-
-                    numofnodes = len(self.nodename)
-
-                    for node in range(numofnodes):
-                        try:
-
-                            # is MAC is not active then send magic packet
-                            if self.is_active_ip(self.extranodeip[node]):
-
-                                # Execute the shell command
-
-                                resultProces = subprocess.run(
-                                    ["sshpass",
-                                        "-p",
-                                        f"{self.nodepwd[node]}",
-                                        "ssh",
-                                        "-p",
-                                        f"{self.extranodesshport[node]}",
-                                        "-t",
-                                        f"{self.nodeuser[node]}"
-                                        f"@{self.extranodeip[node]}",
-                                        f"echo {self.nodepwd[node]}"
-                                        f"|sudo -S bash -c "
-                                        f"{self.poweroffcommand}"],
-                                    capture_output=True, text=True)
-
-                                # Print the command output
-                                logging.info(resultProces.stdout)
-
-                                self.message = \
-                                    self.userPushover.send_message(
-                                        message=f"PowerOff Extra Nodes - "
-                                        f"SLEEP command sent for "
-                                        f"{self.nodename[node]}\n",
-                                        sound=self.pushover_sound
-                                        )
-
-                                logging.info(
-                                    f"PowerOff - Sending SLEEP command for"
-                                    f" {self.nodename[node]}"
-                                    )
-
-                                self.writeLog(
-                                    False,
-                                    f"PowerOff - Sending SLEEP command for"
-                                    f" {self.nodename[node]}\n"
-                                    )
-
-                        except ValueError:
-                            logging.error(
-                                "Invalid MAC-address in INI."
+        # Port is open of the master node
+        if not common.is_port_open(self.nodeip, self.nodeport):
+            if not self.dry_run:
+
+                # Bind the node lists to locals for the loop
+                names = self.nodename
+                ips = self.extranodeip
+                pwds = self.nodepwd
+                users = self.nodeuser
+                sshports = self.extranodesshport
+                poweroffcommand = self.poweroffcommand
+                writeLog = self.writeLog
+
+                activeips = common.active_ips(ips)
+
+                notifications = []
+                for node in range(len(names)):
+                    try:
+
+                        # is MAC is not active then send magic packet
+                        if ips[node] in activeips:
+
+                            # Execute the shell command
+
+                            resultProces = subprocess.run(
+                                ["sshpass",
+                                    "-p",
+                                    f"{pwds[node]}",
+                                    "ssh",
+                                    "-p",
+                                    f"{sshports[node]}",
+                                    "-t",
+                                    f"{users[node]}"
+                                    f"@{ips[node]}",
+                                    f"echo {pwds[node]}"
+                                    f"|sudo -S bash -c "
+                                    f"{poweroffcommand}"],
+                                capture_output=True, text=True)
+
+                            # Print the command output
+                            logging.info(resultProces.stdout)
+
+                            notifications.append(
+                                f"PowerOff Extra Nodes - "
+                                f"SLEEP command sent for "
+                                f"{names[node]}"
                             )
 
+                            logging.info(
+                                f"PowerOff - Sending SLEEP command for"
+                                f" {names[node]}"
+                                )
+
+                            writeLog(
+                                False,
+                                f"PowerOff - Sending SLEEP command for"
+                                f" {names[node]}\n"
+                                )
+
+                    except ValueError:
+                        logging.error(
+                            "Invalid MAC-address in INI."
+                        )
+
+                # one Pushover message for all nodes of this run
+                if notifications:
+                    self.message = common.send_pushover(
+                        self.userPushover, notifications,
+                        self.pushover_sound)
+
 
 if __name__ == '__main__':
 
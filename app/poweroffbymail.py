@@ -3,23 +3,37 @@
 # date: 2023-12-28 20:02:00
 # update: 2023-12-28 20:02:00
 
+import atexit
+import functools
 import imaplib
 import email
+import email.parser
 import re
 import logging
 import sys
 import configparser
+import shlex
 import shutil
 import smtplib
-import socket
 import subprocess
 
 from datetime import datetime
-from email.header import decode_header
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 from socket import gaierror
-from chump import Application
+import common
+import imapidle
+
+_FROM_RE = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+# minute and hour fields of the poweroff.py line, [ \t] keeps the
+# match on that one line
+_CRON_RE = re.compile(
+    r'^(\S+)[ \t]+(\S+)([ \t]+.*poweroff\.py.*)$', re.M)
+_HEADER_PARSER = email.parser.BytesHeaderParser()
+
+
+def reset_crontab(content, fields):
+    # Put fields in place of the minute and hour of the poweroff.py line
+    return _CRON_RE.sub(
+        lambda line: fields + line.group(3), content, count=1)
 
 
 class POBE():
@@ -38,104 +52,183 @@ class POBE():
         self.log_file = "poweroffbymail.log"
 
         self.config_filePath = f"{config_dir}{self.config_file}"
+        self.exampleconfig_filePath = f"{config_dir}{self.exampleconfigfile}"
+        self.exampleconfig_appPath = f"{app_dir}{self.exampleconfigfile}"
         self.log_filePath = f"{log_dir}{self.log_file}"
 
+        # SMTP session, opened on the first reply
+        self.smtp = None
+
+        self.load_config()
+
+        # Keep the log open and buffered, it is written out on exit
         try:
-            with open(self.config_filePath, "r") as f:
-                f.close()
-            try:
-                self.config = configparser.ConfigParser()
-                self.config.read(self.config_filePath)
-
-                # GENERAL
-                self.enabled = True if (
-                    self.config['GENERAL']['ENABLED'] == "ON") else False
-                self.dry_run = True if (
-                    self.config['GENERAL']['DRY_RUN'] == "ON") else False
-                self.verbose_logging = True if (
-                    self.config['GENERAL']['VERBOSE_LOGGING'] == "ON") \
-                    else False
-
-                # NODE
-                self.nodename = self.config['NODE']['NODE_NAME']
-                self.nodeip = self.config['NODE']['NODE_IP']
-                self.nodeport = int(self.config['NODE']['NODE_PORT'])
-                self.nodesshport = int(self.config['NODE']['NODE_SSHPORT'])
-                self.nodeuser = self.config['NODE']['NODE_USER']
-                self.nodepwd = self.config['NODE']['NODE_PWD']
-
-                # MAIL
-                self.mail_port = int(
-                    self.config['MAIL']['MAIL_PORT'])
-                self.mail_server = self.config['MAIL']['MAIL_SERVER']
-                self.mail_login = self.config['MAIL']['MAIL_LOGIN']
-                self.mail_password = self.config['MAIL']['MAIL_PASSWORD']
-                self.mail_sender = self.config['MAIL']['MAIL_SENDER']
-
-                # POWEROFF
-                self.keyword = self.config['POWEROFF']['KEYWORD']
-                self.allowed_senders = list(
-                    self.config['POWEROFF']['ALLOWED_SENDERS'].split(","))
-                self.poweroffcommand = \
-                    self.config['POWEROFF']['POWEROFFCOMMAND']
-
-                # EXTENDTIME
-                self.defaulthour = self.config['EXTENDTIME']['DEFAULT_HOUR']
-                self.defaultminutes = \
-                    self.config['EXTENDTIME']['DEFAULT_MINUTES']
-                self.maxhour = \
-                    self.config['EXTENDTIME']['MAX_SHUTDOWN_HOUR_TIME']
-
-                # PUSHOVER
-                self.pushover_user_key = self.config['PUSHOVER']['USER_KEY']
-                self.pushover_token_api = self.config['PUSHOVER']['TOKEN_API']
-                self.pushover_sound = self.config['PUSHOVER']['SOUND']
-
-            except KeyError as e:
-                logging.error(
-                    f"Seems a key(s) {e} is missing from INI file. "
-                    f"Please check for mistakes. Exiting."
-                )
-
-                sys.exit()
-
-            except ValueError as e:
-                logging.error(
-                    f"Seems a invalid value in INI file. "
-                    f"Please check for mistakes. Exiting. "
-                    f"MSG: {e}"
-                )
-
-                sys.exit()
-
-        except IOError or FileNotFoundError:
+            self.logfile = open(self.log_filePath, "a", buffering=65536)
+            atexit.register(self.logfile.close)
+        except IOError:
+            self.logfile = None
+            logging.error(
+                f"Can't write file {self.log_filePath}."
+            )
+
+    def load_config(self):
+        # Read the INI, --idle rereads it before every pass
+        self.config = configparser.ConfigParser()
+        if not self.config.read(self.config_filePath):
             logging.error(
                 f"Can't open file {self.config_filePath}"
                 f", creating example INI file."
             )
 
-            shutil.copyfile(f'{app_dir}{self.exampleconfigfile}',
-                            f'{config_dir}{self.exampleconfigfile}')
+            shutil.copyfile(self.exampleconfig_appPath,
+                            self.exampleconfig_filePath)
+            sys.exit()
+
+        try:
+            # Look up every section once, the keys are read from these
+            general = self.config['GENERAL']
+            node = self.config['NODE']
+            mail = self.config['MAIL']
+            poweroff = self.config['POWEROFF']
+            extendtime = self.config['EXTENDTIME']
+            pushover = self.config['PUSHOVER']
+
+            # GENERAL
+            self.enabled = True if (
+                general['ENABLED'] == "ON") else False
+            self.dry_run = True if (
+                general['DRY_RUN'] == "ON") else False
+            self.verbose_logging = True if (
+                general['VERBOSE_LOGGING'] == "ON") else False
+
+            # NODE
+            self.nodename = node['NODE_NAME']
+            self.nodeip = node['NODE_IP']
+            self.nodeport = int(node['NODE_PORT'])
+            self.nodesshport = int(node['NODE_SSHPORT'])
+            self.nodeuser = node['NODE_USER']
+            self.nodepwd = node['NODE_PWD']
+
+            # MAIL
+            self.mail_port = int(mail['MAIL_PORT'])
+            self.mail_server = mail['MAIL_SERVER']
+            self.mail_login = mail['MAIL_LOGIN']
+            self.mail_password = mail['MAIL_PASSWORD']
+            self.mail_sender = mail['MAIL_SENDER']
+
+            # POWEROFF
+            self.keyword = poweroff['KEYWORD']
+            self.keyword_cf = self.keyword.casefold()
+            # Addresses are compared casefolded, spaces around commas ignored
+            self.allowed_senders = frozenset(
+                sender.strip().casefold()
+                for sender in poweroff['ALLOWED_SENDERS'].split(",")
+                if sender.strip())
+            self.poweroffcommand = poweroff['POWEROFFCOMMAND']
+
+            # EXTENDTIME
+            self.defaulthour = extendtime['DEFAULT_HOUR']
+            self.defaultminutes = extendtime['DEFAULT_MINUTES']
+            self.maxhour = extendtime['MAX_SHUTDOWN_HOUR_TIME']
+            self.crontabfields = (
+                f"{self.defaultminutes} "
+                f"{self.defaulthour},{self.maxhour}"
+            )
+
+            # ssh command for SLEEP, the password is shell quoted for
+            # echo, the command is passed on as written in the INI
+            self.ssh_command = [
+                "sshpass", "-p", self.nodepwd,
+                "ssh",
+                "-p", f"{self.nodesshport}",
+                "-t", f"{self.nodeuser}@{self.nodeip}",
+                f"echo {shlex.quote(self.nodepwd)}"
+                f"|sudo -S bash -c {self.poweroffcommand}"
+            ]
+
+            # Reply mails, only the To header is added per reply
+            mail_headers = (
+                f"From: {self.mail_sender}\r\n"
+                f"Subject: PowerOff - {self.nodename}\r\n"
+                f"MIME-Version: 1.0\r\n"
+                f"Content-Type: text/plain; charset=UTF-8\r\n"
+                f"Content-Transfer-Encoding: 8bit\r\n"
+                f"\r\n"
+            )
+            self.mail_sleep = (mail_headers + (
+                f"Hi,\r\n\r\n {self.nodename} "
+                f"wordt uitgezet, "
+                f"even geduld.\r\n\r\n"
+                f"Fijne dag!\r\n\r\n"
+            )).encode("utf-8")
+            self.mail_already_off = (mail_headers + (
+                f"Hi,\r\n\r\n {self.nodename} is al uit, "
+                f"Je hoeft het 'power off' "
+                f"commando niet meer te sturen.\r\n\r\n"
+                f"Fijne dag!\r\n\r\n"
+            )).encode("utf-8")
+            self.mail_disabled = (mail_headers + (
+                "Hi,\r\n\r\n Service staat uit "
+                ", je hoeft even geen commando's "
+                "te sturen.\r\n\r\n"
+                "Fijne dag!\r\n\r\n"
+            )).encode("utf-8")
+
+            # Reply mail by (service enabled, node running)
+            self.mail_replies = {
+                (True, True): self.mail_sleep,
+                (True, False): self.mail_already_off,
+                (False, True): self.mail_disabled,
+                (False, False): self.mail_disabled,
+            }
+
+            # PUSHOVER
+            self.pushover_user_key = pushover['USER_KEY']
+            self.pushover_token_api = pushover['TOKEN_API']
+            self.pushover_sound = pushover['SOUND']
+
+        except KeyError as e:
+            logging.error(
+                f"Seems a key(s) {e} is missing from INI file. "
+                f"Please check for mistakes. Exiting."
+            )
+
+            sys.exit()
+
+        except ValueError as e:
+            logging.error(
+                f"Seems a invalid value in INI file. "
+                f"Please check for mistakes. Exiting. "
+                f"MSG: {e}"
+            )
+
             sys.exit()
 
     def writeLog(self, init, msg):
+        if self.logfile is None:
+            return
         try:
             if init:
-                logfile = open(self.log_filePath, "w")
-            else:
-                logfile = open(self.log_filePath, "a")
-            logfile.write(f"{datetime.now()} - {msg}")
-            logfile.close()
+                self.logfile.truncate(0)
+            self.logfile.write(f"{datetime.now()} - {msg}")
         except IOError:
             logging.error(
                 f"Can't write file {self.log_filePath}."
             )
 
-    def run(self):
-        # Setting for PushOver
-        self.appPushover = Application(self.pushover_token_api)
-        self.userPushover = self.appPushover.get_user(self.pushover_user_key)
+    def emit(self, msg, always=False):
+        # Format once, write to the console (when verbose) and the log file
+        if always or self.verbose_logging:
+            logging.info(msg)
+        self.writeLog(False, f"{msg}\n")
 
+    @functools.cached_property
+    def userPushover(self):
+        # Setting for PushOver, only once a message is actually sent
+        return common.pushover_user(
+            self.pushover_token_api, self.pushover_user_key)
+
+    def connect(self):
         if self.dry_run:
             logging.info(
                 "********************************************")
@@ -154,298 +247,231 @@ class POBE():
         # authenticate
         imap.login(self.mail_login, self.mail_password)
 
-        status, messages = imap.select("INBOX")
+        return imap
 
-        # total number of emails
-        messages = int(messages[0])
+    def mail_session(self):
+        # Log in on the first reply of a pass and reuse the session for
+        # the rest of that pass
+        if self.smtp is not None:
+            try:
+                # a server that timed out the session answers 421
+                if self.smtp.noop()[0] == 250:
+                    return self.smtp
+            except smtplib.SMTPServerDisconnected:
+                pass
+            self.end_mail_session()
+
+        self.smtp = common.smtp_login(
+            self.mail_server, self.mail_port,
+            self.mail_login, self.mail_password)
+        return self.smtp
+
+    def end_mail_session(self):
+        # Quit after every pass, the server drops idle sessions anyway
+        if self.smtp is not None:
+            common.smtp_quit(self.smtp)
+            self.smtp = None
 
-        for i in range(1, messages+1):
+    def run(self):
+        imap = self.connect()
 
-            # fetch the email message by ID
-            res, msg = imap.fetch(str(i), "(RFC822)")
-            for response in msg:
-                if isinstance(response, tuple):
-                    # parse a bytes email into a message object
-                    msg = email.message_from_bytes(response[1])
+        self.process_inbox(imap)
 
-                    # decode the email subject
-                    subject, encoding = decode_header(msg["Subject"])[0]
+        # close the connection and logout
+        imap.close()
+        imap.logout()
 
-                    if isinstance(subject, bytes):
-                        # if it's a bytes, decode to str
-                        if encoding:
-                            subject = subject.decode(encoding)
-                        else:
-                            subject = subject.decode("utf-8")
+    def idle(self):
+        # Keep one IMAP connection open and handle new mail as it arrives
+        imapidle.idle(
+            "PowerOff", self.connect, self.idle_pass, self.logfile)
 
-                    # decode email sender
-                    From, encoding = decode_header(msg.get("From"))[-1:][0]
+    def idle_pass(self, imap):
+        # A cron run starts from the INI as it is on disk, pick up
+        # any change before handling new mail
+        self.load_config()
+        self.process_inbox(imap)
 
-                    if isinstance(From, bytes):
-                        if encoding:
-                            From = From.decode(encoding)
-                        else:
-                            From = From.decode("utf-8")
+    def sender_match(self, msg):
+        # decode email sender
+        From = common.header_part(msg.get("From"), -1)
 
-                    match = re.search(r'[\w.+-]+@[\w-]+\.[\w.-]+', From)
+        return _FROM_RE.search(From)
 
-                    if str.lower(subject) == self.keyword.lower():
+    def process_inbox(self, imap):
+        imap.select("INBOX")
 
-                        if self.verbose_logging:
-                            logging.info(
-                                f"PowerOff - Found matching subject from "
-                                f"{match.group(0)}"
-                            )
-                        self.writeLog(
-                            False, f"PowerOff - Found matching subject from "
-                            f"{match.group(0)}\n")
-
-                        if match.group(0) in self.allowed_senders:
-
-                            if self.enabled:
-                                sock = socket.socket(
-                                    socket.AF_INET, socket.SOCK_STREAM)
-                                result = sock.connect_ex(
-                                    (self.nodeip, self.nodeport))
-                                if result == 0:
-                                    if not self.dry_run:
-                                        try:
-                                            # Execute the shell command
-
-                                            ecsapedpwd = re.escape(
-                                                self.nodepwd)
-
-                                            resultProces = subprocess.run(
-                                                ["sshpass",
-                                                    "-p",
-                                                    f"{self.nodepwd}",
-                                                    "ssh",
-                                                    "-p",
-                                                    f"{self.nodesshport}",
-                                                    "-t",
-                                                    f"{self.nodeuser}"
-                                                    f"@{self.nodeip}",
-                                                    f"echo {ecsapedpwd}"
-                                                    f"|sudo -S bash -c "
-                                                    f"{self.poweroffcommand}"],
-                                                capture_output=True, text=True)
-
-                                            # Print the command output
-                                            logging.info(resultProces.stdout)
-
-                                        except ValueError:
-                                            logging.error(
-                                                "Invalid MAC-address in INI."
-                                            )
-                                            sys.exit()
+        # let the server look up the emails with the keyword in the subject
+        messages = common.search_subject(imap, self.keyword)
 
+        if not messages:
+            return
+
+        # fetch Subject and From of those emails in one go,
+        # leave the \Seen flag
+        res, data = imap.fetch(
+            b",".join(messages), "(BODY.PEEK[HEADER.FIELDS (SUBJECT FROM)])")
+        to_delete = []
+        notifications = []
+        for response in data:
+            if isinstance(response, tuple):
+                # message ID from the response, b'3 (BODY[HEADER...'
+                i = int(response[0].split()[0])
+
+                # parse the header bytes into a message object
+                msg = _HEADER_PARSER.parsebytes(response[1])
+
+                # decode the email subject
+                subject = common.header_part(msg["Subject"], 0)
+
+                # the sender is only looked at once the subject matched
+                if subject.casefold() == self.keyword_cf:
+                    match = self.sender_match(msg)
+
+                    self.emit(
+                        f"PowerOff - Found matching subject from "
+                        f"{match.group(0)}")
+
+                    if match.group(0).casefold() in self.allowed_senders:
+
+                        if self.enabled:
+                            result = 0 if common.is_port_open(
+                                self.nodeip, self.nodeport) else 1
+                            if result == 0:
+                                if not self.dry_run:
                                     try:
-                                        with open("/etc/crontabs/root", 'r')\
-                                              as file:
-                                            content = file.read()
-                                            file.close()
-
-                                            lines = content.split('\n')
-
-                                            for line in range(len(lines)):
-                                                if "poweroff.py" in \
-                                                        lines[line]:
-
-                                                    line_parts = \
-                                                        lines[line].split()
-
-                                                    line_parts[1] = (
-                                                        f"{self.defaulthour},"
-                                                        f"{self.maxhour}"
-                                                        )
-                                                    line_parts[0] = \
-                                                        self.defaultminutes
-
-                                                    lines[line] = \
-                                                        ' '.join(line_parts)
-                                                    break
-
-                                            new_text = '\n'.join(lines)
-
-                                            try:
-                                                with open(
-                                                    "/etc/crontabs/root",
-                                                        'w') as file:
-                                                    file.write(new_text)
-                                                    file.close()
-
-                                            except IOError:
-                                                logging.error(
-                                                    "Error writing the "
-                                                    "file /etc/crontabs/root.")
-
-                                    except FileNotFoundError:
-                                        logging.error(
-                                            "File not found - "
-                                            "/etc/crontabs/root.")
-                                    except IOError:
-                                        logging.error(
-                                            "Error reading the"
-                                            " file /etc/crontabs/root.")
+                                        # Execute the shell command
 
-                                    logging.info(
-                                        f"PowerOff - Sending SLEEP command by"
-                                        f" {match.group(0)}"
-                                        )
-                                    self.writeLog(
-                                        False,
-                                        f"PowerOff - Sending SLEEP command by"
-                                        f" {match.group(0)}\n"
-                                    )
-
-                                    self.message = \
-                                        self.userPushover.send_message(
-                                            message=f"PowerOffByEmail - "
-                                            f"SLEEP command sent by "
-                                            f"{match.group(0)}\n",
-                                            sound=self.pushover_sound
-                                            )
-
-                                else:
-                                    logging.info(
-                                        f"PowerOff - Nodes not running"
-                                        f" by {match.group(0)}"
-                                    )
-                                    self.writeLog(
-                                        False,
-                                        f"PowerOff - Nodes not running by "
-                                        f"{match.group(0)}\n"
-                                    )
-                            else:
-                                if self.verbose_logging:
-                                    logging.info(
-                                        f"PowerOff - Service is disabled by "
-                                        f"{match.group(0)}"
-                                    )
-                                self.writeLog(
-                                    False,
-                                    f"PowerOff - Service is disabled by "
-                                    f"{match.group(0)}\n"
-                                )
+                                        resultProces = subprocess.run(
+                                            self.ssh_command,
+                                            capture_output=True, text=True)
 
-                            sender_email = self.mail_sender
-                            receiver_email = match.group(0)
+                                        # Print the command output
+                                        logging.info(resultProces.stdout)
 
-                            message = MIMEMultipart()
-                            message["From"] = sender_email
-                            message['To'] = receiver_email
-                            message['Subject'] = (
-                                f"PowerOff - {self.nodename}"
-                            )
+                                    except ValueError:
+                                        logging.error(
+                                            "Invalid MAC-address in INI."
+                                        )
+                                        sys.exit()
 
-                            if self.enabled:
-                                if result == 0:
-                                    body = (
-                                        f"Hi,\n\n {self.nodename} "
-                                        f"wordt uitgezet, "
-                                        f"even geduld.\n\n"
-                                        f"Fijne dag!\n\n"
-                                    )
-                                else:
-                                    body = (
-                                        f"Hi,\n\n {self.nodename} is al uit, "
-                                        f"Je hoeft het 'power off' "
-                                        f"commando niet meer te sturen.\n\n"
-                                        f"Fijne dag!\n\n"
-                                    )
-                            else:
-                                body = (
-                                    "Hi,\n\n Service staat uit "
-                                    ", je hoeft even geen commando's "
-                                    "te sturen.\n\n"
-                                    "Fijne dag!\n\n"
-                                )
+                                try:
+                                    with open("/etc/crontabs/root", 'r')\
+                                          as file:
+                                        content = file.read()
 
-                            plain_text = MIMEText(
-                                body, _subtype='plain', _charset='UTF-8')
-                            message.attach(plain_text)
-
-                            my_message = message.as_string()
-
-                            try:
-                                email_session = smtplib.SMTP(
-                                    self.mail_server, self.mail_port)
-                                email_session.starttls()
-                                email_session.login(
-                                    self.mail_login, self.mail_password)
-                                email_session.sendmail(
-                                    sender_email,
-                                    [receiver_email],
-                                    my_message
-                                    )
-                                email_session.quit()
-                                if self.verbose_logging:
-                                    logging.info(
-                                        f"PowerOff - Mail Sent to "
-                                        f"{receiver_email}."
-                                    )
-
-                                self.writeLog(
-                                    False,
-                                    f"PowerOff - Mail Sent to "
-                                    f"{receiver_email}.\n"
-                                )
+                                    new_text = reset_crontab(
+                                        content, self.crontabfields)
 
-                            except (gaierror, ConnectionRefusedError):
-                                logging.error(
-                                    "Failed to connect to the server. "
-                                    "Bad connection settings?")
-                            except smtplib.SMTPServerDisconnected:
-                                logging.error(
-                                    "Failed to connect to the server. "
-                                    "Wrong user/password?"
+                                    # only rewrite when the line changed
+                                    if new_text != content:
+                                        try:
+                                            with open(
+                                                "/etc/crontabs/root",
+                                                    'w') as file:
+                                                file.write(new_text)
+
+                                        except IOError:
+                                            logging.error(
+                                                "Error writing the "
+                                                "file /etc/crontabs/root.")
+
+                                except FileNotFoundError:
+                                    logging.error(
+                                        "File not found - "
+                                        "/etc/crontabs/root.")
+                                except IOError:
+                                    logging.error(
+                                        "Error reading the"
+                                        " file /etc/crontabs/root.")
+
+                                self.emit(
+                                    f"PowerOff - Sending SLEEP command by"
+                                    f" {match.group(0)}", always=True)
+
+                                notifications.append(
+                                    f"PowerOffByEmail - "
+                                    f"SLEEP command sent by "
+                                    f"{match.group(0)}"
                                 )
-                            except smtplib.SMTPException as e:
-                                logging.error(
-                                    f"SMTP error occurred: {str(e)}.")
 
+                            else:
+                                self.emit(
+                                    f"PowerOff - Nodes not running by "
+                                    f"{match.group(0)}", always=True)
                         else:
-                            if self.verbose_logging:
-                                logging.info(
-                                    f"PowerOff - sender not in"
-                                    f" list {match.group(0)}."
-                                    )
-                            self.writeLog(
-                                False,
-                                f"PowerOff - sender not in list "
-                                f"{match.group(0)}.\n"
-                            )
+                            self.emit(
+                                f"PowerOff - Service is disabled by "
+                                f"{match.group(0)}")
 
-                        if self.verbose_logging:
-                            logging.info(
-                                "PowerOff - Marking message for delete.")
-                        self.writeLog(
-                            False, "PowerOff - Marking message for delete.\n")
+                        sender_email = self.mail_sender
+                        receiver_email = match.group(0)
 
-                        if not self.dry_run:
-                            imap.store(str(i), "+FLAGS", "\\Deleted")
-                    else:
-                        if self.verbose_logging:
-                            logging.info(
-                                f"PowerOff - Subject not recognized. "
-                                f"Skipping message. "
-                                f"{match.group(0)}"
-                            )
+                        reply = self.mail_replies[
+                            self.enabled, self.enabled and result == 0]
+
+                        my_message = b"To: %s\r\n%s" % (
+                            receiver_email.encode(), reply)
 
-                            self.writeLog(
-                                False,
-                                f"PowerOff - Subject not recognized. "
-                                f"Skipping message. {match.group(0)}\n"
+                        try:
+                            email_session = self.mail_session()
+                            email_session.sendmail(
+                                sender_email,
+                                [receiver_email],
+                                my_message
+                                )
+                            self.emit(
+                                f"PowerOff - Mail Sent to "
+                                f"{receiver_email}.")
+
+                        except (gaierror, ConnectionRefusedError):
+                            logging.error(
+                                "Failed to connect to the server. "
+                                "Bad connection settings?")
+                        except smtplib.SMTPServerDisconnected:
+                            logging.error(
+                                "Failed to connect to the server. "
+                                "Wrong user/password?"
                             )
+                        except smtplib.SMTPException as e:
+                            logging.error(
+                                f"SMTP error occurred: {str(e)}.")
+
+                    else:
+                        self.emit(
+                            f"PowerOff - sender not in list "
+                            f"{match.group(0)}.")
+
+                    self.emit("PowerOff - Marking message for delete.")
+
+                    to_delete.append(str(i))
+                else:
+                    if self.verbose_logging:
+                        match = self.sender_match(msg)
+                        self.emit(
+                            f"PowerOff - Subject not recognized. "
+                            f"Skipping message. {match.group(0)}")
+
+        # flag all handled emails for delete in one go, before the
+        # notification so a Pushover error never handles them twice
+        if to_delete and not self.dry_run:
+            imap.store(",".join(to_delete), "+FLAGS", "\\Deleted")
 
-        # close the connection and logout
         imap.expunge()
-        imap.close()
-        imap.logout()
+
+        # one Pushover message for all SLEEP commands of this pass
+        if notifications:
+            self.message = common.send_pushover(
+                self.userPushover, notifications, self.pushover_sound)
+
+        self.end_mail_session()
 
 
 if __name__ == '__main__':
 
     PowerOffbyemail = POBE()
-    PowerOffbyemail.run()
+    if "--idle" in sys.argv[1:]:
+        PowerOffbyemail.idle()
+    else:
+        PowerOffbyemail.run()
     PowerOffbyemail = None
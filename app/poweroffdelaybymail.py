@@ -3,23 +3,26 @@
 # date: 2023-12-29 21:34:00
 # update: 2023-12-29 21:34:00
 
+import atexit
+import functools
 import imaplib
-import email
+import email.parser
 import re
 import logging
+import os
 import sys
 import configparser
 import shutil
 import smtplib
-import socket
-import subprocess
 
 from datetime import datetime
-from email.header import decode_header
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from email.message import EmailMessage
 from socket import gaierror
-from chump import Application
+import common
+import imapidle
+
+_FROM_RE = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+_HEADER_PARSER = email.parser.BytesHeaderParser()
 
 
 class POD():
@@ -34,195 +37,265 @@ class POD():
         log_dir = "/logging/poweron/"
 
         self.crontab_file = "/etc/crontabs/root"
+        self.crontab_update = "/etc/crontabs/cron.update"
         self.shutdowntime = "00:00"
         self.maxshutdowntime = "00:00"
 
+        # Seconds to wait for the node before it counts as not running
+        self.probe_timeout = 2.0
+
         self.config_file = "poweron.ini"
         self.exampleconfigfile = "poweron.ini.example"
         self.log_file = "poweronbymail.log"
 
         self.config_filePath = f"{config_dir}{self.config_file}"
+        self.exampleconfig_filePath = f"{config_dir}{self.exampleconfigfile}"
+        self.exampleconfig_appPath = f"{app_dir}{self.exampleconfigfile}"
         self.log_filePath = f"{log_dir}{self.log_file}"
 
-        try:
-            with open(self.config_filePath, "r") as f:
-                f.close()
-            try:
-                self.config = configparser.ConfigParser()
-                self.config.read(self.config_filePath)
-
-                # GENERAL
-                self.enabled = True if (
-                    self.config['GENERAL']['ENABLED'] == "ON") else False
-                self.dry_run = True if (
-                    self.config['GENERAL']['DRY_RUN'] == "ON") else False
-                self.verbose_logging = True if (
-                    self.config['GENERAL']['VERBOSE_LOGGING'] == "ON") \
-                    else False
-
-                # NODE
-                self.nodename = self.config['NODE']['NODE_NAME']
-                self.macaddress = self.config['NODE']['NODE_MAC']\
-                    .replace(":", "-").lower()
-                self.nodeip = self.config['NODE']['NODE_IP']
-                self.nodeport = int(self.config['NODE']['NODE_PORT'])
-
-                # MAIL
-                self.mail_port = int(
-                    self.config['MAIL']['MAIL_PORT'])
-                self.mail_server = self.config['MAIL']['MAIL_SERVER']
-                self.mail_login = self.config['MAIL']['MAIL_LOGIN']
-                self.mail_password = self.config['MAIL']['MAIL_PASSWORD']
-                self.mail_sender = self.config['MAIL']['MAIL_SENDER']
-
-                # EXTENDTIME
-                self.keyword = self.config['EXTENDTIME']['KEYWORD']
-                self.allowed_senders = list(
-                    self.config['EXTENDTIME']['ALLOWED_SENDERS'].split(","))
-                self.extendhour = \
-                    self.config['EXTENDTIME']['EXTEND_TIME_IN_HOURS']
-                self.maxhour = \
-                    self.config['EXTENDTIME']['MAX_SHUTDOWN_HOUR_TIME']
-                self.defaultminutes = \
-                    self.config['EXTENDTIME']['DEFAULT_MINUTES']
-                self.maxshutdowntime = (
-                    f"{self.maxhour.zfill(2)}:{self.defaultminutes.zfill(2)}")
-
-                # PUSHOVER
-                self.pushover_user_key = self.config['PUSHOVER']['USER_KEY']
-                self.pushover_token_api = self.config['PUSHOVER']['TOKEN_API']
-                self.pushover_sound = self.config['PUSHOVER']['SOUND']
-
-            except KeyError as e:
-                logging.error(
-                    f"Seems a key(s) {e} is missing from INI file. "
-                    f"Please check for mistakes. Exiting."
-                )
-
-                sys.exit()
+        # SMTP session, opened on the first status mail
+        self.smtp = None
 
-            except ValueError as e:
-                logging.error(
-                    f"Seems a invalid value in INI file. "
-                    f"Please check for mistakes. Exiting. "
-                    f"MSG: {e}"
-                )
+        self.load_config()
 
-                sys.exit()
+        # Keep the log open and buffered, it is written out on exit
+        try:
+            self.logfile = open(self.log_filePath, "a", buffering=65536)
+            atexit.register(self.logfile.close)
+        except IOError:
+            self.logfile = None
+            logging.error(
+                f"Can't write file {self.log_filePath}."
+            )
 
-        except IOError or FileNotFoundError:
+    def load_config(self):
+        # Read the INI, --idle rereads it before every pass
+        self.config = configparser.ConfigParser()
+        if not self.config.read(self.config_filePath):
             logging.error(
                 f"Can't open file {self.config_filePath}"
                 f", creating example INI file."
             )
 
-            shutil.copyfile(f'{app_dir}{self.exampleconfigfile}',
-                            f'{config_dir}{self.exampleconfigfile}')
+            shutil.copyfile(self.exampleconfig_appPath,
+                            self.exampleconfig_filePath)
+            sys.exit()
+
+        try:
+            # GENERAL
+            self.enabled = True if (
+                self.config['GENERAL']['ENABLED'] == "ON") else False
+            self.dry_run = True if (
+                self.config['GENERAL']['DRY_RUN'] == "ON") else False
+            self.verbose_logging = True if (
+                self.config['GENERAL']['VERBOSE_LOGGING'] == "ON") \
+                else False
+
+            # NODE
+            self.nodename = self.config['NODE']['NODE_NAME']
+            self.macaddress = self.config['NODE']['NODE_MAC']\
+                .replace(":", "-").lower()
+            self.nodeip = self.config['NODE']['NODE_IP']
+            self.nodeport = int(self.config['NODE']['NODE_PORT'])
+
+            # MAIL
+            self.mail_port = int(
+                self.config['MAIL']['MAIL_PORT'])
+            self.mail_server = self.config['MAIL']['MAIL_SERVER']
+            self.mail_login = self.config['MAIL']['MAIL_LOGIN']
+            self.mail_password = self.config['MAIL']['MAIL_PASSWORD']
+            self.mail_sender = self.config['MAIL']['MAIL_SENDER']
+
+            # EXTENDTIME
+            self.keyword = self.config['EXTENDTIME']['KEYWORD']
+            self.keyword_cf = self.keyword.casefold()
+            self.allowed_senders = [
+                sender.strip() for sender in
+                self.config['EXTENDTIME']['ALLOWED_SENDERS'].split(",")
+                if sender.strip()]
+
+            # Addresses are compared casefolded
+            self.allowed_senders_set = frozenset(
+                sender.casefold() for sender in self.allowed_senders)
+            self.extendhour = \
+                self.config['EXTENDTIME']['EXTEND_TIME_IN_HOURS']
+            self.maxhour = \
+                self.config['EXTENDTIME']['MAX_SHUTDOWN_HOUR_TIME']
+            self.defaultminutes = \
+                self.config['EXTENDTIME']['DEFAULT_MINUTES']
+            self.maxshutdowntime = (
+                f"{self.maxhour.zfill(2)}:{self.defaultminutes.zfill(2)}")
+
+            # hours as numbers for the crontab bump, a max hour of
+            # midnight compares as 24
+            self.extendhours = int(self.extendhour)
+            self.maxhour_compare = 24 if (
+                self.maxhour in ["0", "00"]) else int(self.maxhour)
+
+            # PUSHOVER
+            self.pushover_user_key = self.config['PUSHOVER']['USER_KEY']
+            self.pushover_token_api = self.config['PUSHOVER']['TOKEN_API']
+            self.pushover_sound = self.config['PUSHOVER']['SOUND']
+
+        except KeyError as e:
+            logging.error(
+                f"Seems a key(s) {e} is missing from INI file. "
+                f"Please check for mistakes. Exiting."
+            )
+
+            sys.exit()
+
+        except ValueError as e:
+            logging.error(
+                f"Seems a invalid value in INI file. "
+                f"Please check for mistakes. Exiting. "
+                f"MSG: {e}"
+            )
+
             sys.exit()
 
     def writeLog(self, init, msg):
+        if self.logfile is None:
+            return
         try:
             if init:
-                logfile = open(self.log_filePath, "w")
-            else:
-                logfile = open(self.log_filePath, "a")
-            logfile.write(f"{datetime.now()} - {msg}")
-            logfile.close()
+                self.logfile.truncate(0)
+            self.logfile.write(f"{datetime.now()} - {msg}")
         except IOError:
             logging.error(
                 f"Can't write file {self.log_filePath}."
             )
 
-    def changeCrontab(self, mailer):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        result = sock.connect_ex((self.nodeip, self.nodeport))
+    def mail_session(self):
+        # Log in on the first status mail of a pass and reuse the session for
+        # the rest of that pass
+        if self.smtp is not None:
+            try:
+                # a server that timed out the session answers 421
+                if self.smtp.noop()[0] == 250:
+                    return self.smtp
+            except smtplib.SMTPServerDisconnected:
+                pass
+            self.end_mail_session()
+
+        self.smtp = common.smtp_login(
+            self.mail_server, self.mail_port,
+            self.mail_login, self.mail_password)
+        return self.smtp
+
+    def end_mail_session(self):
+        # Quit after every pass, the server drops idle sessions anyway
+        if self.smtp is not None:
+            common.smtp_quit(self.smtp)
+            self.smtp = None
+
+    def loadCrontab(self):
+        try:
+            with open(f"{self.crontab_file}", 'r') as file:
+                return file.read()
 
-        if result == 0:
-            if not self.dry_run:
-                try:
-                    with open(f"{self.crontab_file}", 'r') as file:
-                        content = file.read()
-                        file.close()
-
-                        lines = content.split('\n')
-
-                        for line in range(len(lines)):
-                            if "poweroff.py" in lines[line]:
-                                line_parts = lines[line].split()
-
-                                # als het voorbij
-                                # middernacht is
-                                # Dan bereken
-                                # juiste uur
-
-                                # Split the shoutdown hours
-                                poweroffhours = line_parts[1].split(',')
-
-                                # Add de extend hours to the first hour
-                                poweroffhours[0] = \
-                                    str((int(poweroffhours[0]) +
-                                         int(self.extendhour))
-                                        % 24)
-
-                                # if extend time is past self.maxhour,
-                                # then always shutdown at self.maxhour
-
-                                maxhour_compare = "24" if (
-                                    self.maxhour in ["0", "00"]) else \
-                                    self.maxhour
-
-                                if int(poweroffhours[0]) >= \
-                                        int(maxhour_compare):
-                                    line_parts[1] = self.maxhour
-
-                                    # format the first shutdown time
-                                    self.shutdowntime = (
-                                        f"{line_parts[1].zfill(2)}:"
-                                        f"{line_parts[0].zfill(2)}"
-                                    )
-                                else:
-                                    line_parts[1] = (
-                                        f"{poweroffhours[0]},"
-                                        f"{self.maxhour}"
-                                    )
+        except FileNotFoundError:
+            logging.error(
+                f"File not found - "
+                f"{self.crontab_file}.")
+        except IOError:
+            logging.error(
+                f"Error reading the"
+                f" file {self.crontab_file}.")
+
+        return None
+
+    def bumpCrontab(self, content):
+        # look up the start and end of the poweroff line once per
+        # loaded crontab, only that slice is rewritten
+        if self.poweroff_line is None:
+            pos = content.find("poweroff.py")
+            if pos < 0:
+                self.poweroff_line = ()
+            else:
+                start = content.rfind('\n', 0, pos) + 1
+                end = content.find('\n', pos)
+                if end < 0:
+                    end = len(content)
+                self.poweroff_line = (start, end)
 
-                                    # format the first shutdown time
-                                    self.shutdowntime = (
-                                        f"{poweroffhours[0].zfill(2)}:"
-                                        f"{line_parts[0].zfill(2)}"
-                                    )
+        if not self.poweroff_line:
+            return content
 
-                                lines[line] = ' '.join(line_parts)
-                                break
+        start, end = self.poweroff_line
+        line_parts = content[start:end].split()
 
-                        new_text = '\n'.join(lines)
+        # als het voorbij
+        # middernacht is
+        # Dan bereken
+        # juiste uur
 
-                        try:
-                            with open(f"{self.crontab_file}", 'w') as file:
-                                file.write(new_text)
-                                file.close()
-
-                                command = f"crontab {self.crontab_file}"
-                                command_result = subprocess.run(
-                                    command.split(),
-                                    capture_output=True,
-                                    text=True
-                                )
-                                logging.info(command_result)
+        # Split the shoutdown hours
+        poweroffhours = line_parts[1].split(',')
 
-                        except IOError:
-                            logging.error(
-                                f"Error writing the "
-                                f"file {self.crontab_file}.")
-
-                except FileNotFoundError:
-                    logging.error(
-                        f"File not found - "
-                        f"{self.crontab_file}.")
-                except IOError:
-                    logging.error(
-                        f"Error reading the"
-                        f" file {self.crontab_file}.")
+        # Add de extend hours to the first hour
+        firsthour = (int(poweroffhours[0]) + self.extendhours) % 24
+
+        # if extend time is past self.maxhour,
+        # then always shutdown at self.maxhour
+        if firsthour >= self.maxhour_compare:
+            line_parts[1] = self.maxhour
+
+            # format the first shutdown time
+            self.shutdowntime = (
+                f"{self.maxhour.zfill(2)}:{line_parts[0].zfill(2)}")
+        else:
+            line_parts[1] = f"{firsthour},{self.maxhour}"
+
+            # format the first shutdown time
+            self.shutdowntime = f"{firsthour:02d}:{line_parts[0].zfill(2)}"
+
+        new_line = ' '.join(line_parts)
+        self.poweroff_line = (start, start + len(new_line))
+
+        return content[:start] + new_line + content[end:]
+
+    def installCrontab(self, content):
+        try:
+            # write next to the crontab and swap it in, so crond never
+            # sees a half written file
+            tmp_file = f"{self.crontab_file}.tmp"
+            fd = os.open(
+                tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as file:
+                file.write(content)
+            os.replace(tmp_file, self.crontab_file)
+
+            # tell crond to reload root's crontab, like crontab(1) does
+            with open(self.crontab_update, 'a') as file:
+                file.write("root\n")
+
+        except IOError:
+            logging.error(
+                f"Error writing the "
+                f"file {self.crontab_file}.")
+
+    def is_port_open(self):
+        # Probe the node once per pass, later delays reuse the answer
+        if self.node_running is None:
+            self.node_running = common.is_port_open(
+                self.nodeip, self.nodeport, self.probe_timeout)
+
+        return self.node_running
+
+    def changeCrontab(self, mailer):
+        result = 0 if self.is_port_open() else 1
+
+        if result == 0:
+            if not self.dry_run:
+                # read the crontab on the first delay of this run,
+                # it is installed once after all mails are handled
+                if self.crontab is None:
+                    self.crontab = self.loadCrontab()
+
+                if self.crontab is not None:
+                    self.crontab = self.bumpCrontab(self.crontab)
+                    self.crontab_changed = True
 
             logging.info(
                 f"PowerOffDelay - PowerOffdelay by"
@@ -256,11 +329,13 @@ class POD():
 
         return result
 
-    def run(self):
-        # Setting for PushOver
-        self.appPushover = Application(self.pushover_token_api)
-        self.userPushover = self.appPushover.get_user(self.pushover_user_key)
+    @functools.cached_property
+    def userPushover(self):
+        # Setting for PushOver, only once a message is actually sent
+        return common.pushover_user(
+            self.pushover_token_api, self.pushover_user_key)
 
+    def connect(self):
         if self.dry_run:
             logging.info(
                 "******************************************")
@@ -279,215 +354,238 @@ class POD():
         # authenticate
         imap.login(self.mail_login, self.mail_password)
 
-        status, messages = imap.select("INBOX")
+        return imap
 
-        # total number of emails
-        messages = int(messages[0])
+    def run(self):
+        imap = self.connect()
 
-        for i in range(1, messages+1):
+        self.process_inbox(imap)
 
-            # fetch the email message by ID
-            res, msg = imap.fetch(str(i), "(RFC822)")
-            for response in msg:
-                if isinstance(response, tuple):
-                    # parse a bytes email into a message object
-                    msg = email.message_from_bytes(response[1])
+        # close the connection and logout
+        imap.close()
+        imap.logout()
 
-                    # decode the email subject
-                    subject, encoding = decode_header(msg["Subject"])[0]
+    def idle(self):
+        # Keep one IMAP connection open and handle new mail as it arrives
+        imapidle.idle(
+            "PowerOffDelay", self.connect, self.idle_pass, self.logfile)
 
-                    if isinstance(subject, bytes):
-                        # if it's a bytes, decode to str
-                        if encoding:
-                            subject = subject.decode(encoding)
-                        else:
-                            subject = subject.decode("utf-8")
+    def idle_pass(self, imap):
+        # A cron run starts from the INI as it is on disk, pick up
+        # any change before handling new mail
+        self.load_config()
+        self.process_inbox(imap)
 
-                    # decode email sender
-                    From, encoding = decode_header(msg.get("From"))[-1:][0]
+    def process_inbox(self, imap):
+        # Crontab text and node state, filled on the first delay of
+        # this pass
+        self.crontab = None
+        self.crontab_changed = False
+        self.poweroff_line = None
+        self.node_running = None
 
-                    if isinstance(From, bytes):
-                        if encoding:
-                            From = From.decode(encoding)
-                        else:
-                            From = From.decode("utf-8")
+        imap.select("INBOX")
 
-                    match = re.search(r'[\w.+-]+@[\w-]+\.[\w.-]+', From)
+        # let the server look up the emails with the keyword in the subject
+        messages = common.search_subject(imap, self.keyword)
 
-                    if str.lower(subject) == self.keyword.lower():
+        # fetch Subject and From of those emails in one go,
+        # leave the \Seen flag
+        data = []
+        if messages:
+            res, data = imap.fetch(
+                b",".join(messages),
+                "(BODY.PEEK[HEADER.FIELDS (SUBJECT FROM)])")
 
-                        if self.verbose_logging:
-                            logging.info(
-                                f"PowerOffDelay - Found matching subject from "
-                                f"{match.group(0)}"
-                            )
-                        self.writeLog(
-                            False, f"PowerOffDelay - Found matching "
-                            f"subject from "
-                            f"{match.group(0)}\n")
+        to_delete = []
+        for response in data:
+            if isinstance(response, tuple):
+                # message ID from the response, b'3 (BODY[HEADER...'
+                i = int(response[0].split()[0])
 
-                        if match.group(0) in self.allowed_senders:
+                # parse the header bytes into a message object
+                msg = _HEADER_PARSER.parsebytes(response[1])
 
-                            if self.enabled:
+                # decode the email subject and sender
+                subject = common.header_part(msg["Subject"], 0)
+                From = common.header_part(msg.get("From"), -1)
 
-                                result = self.changeCrontab(match.group(0))
+                match = _FROM_RE.search(From)
 
-                            else:
-                                if self.verbose_logging:
-                                    logging.info(
-                                        f"PowerOffDelay - Service "
-                                        f"is disabled by "
-                                        f"{match.group(0)}"
-                                    )
-                                self.writeLog(
-                                    False,
-                                    f"PowerOffDelay - Service is disabled by "
-                                    f"{match.group(0)}\n"
-                                )
+                if subject.casefold() == self.keyword_cf:
+
+                    if self.verbose_logging:
+                        logging.info(
+                            f"PowerOffDelay - Found matching subject from "
+                            f"{match.group(0)}"
+                        )
+                    self.writeLog(
+                        False, f"PowerOffDelay - Found matching "
+                        f"subject from "
+                        f"{match.group(0)}\n")
+
+                    if match.group(0).casefold() in \
+                            self.allowed_senders_set:
 
-                            sender_email = self.mail_sender
-                            receiver_email = ", ".join(self.allowed_senders)
+                        if self.enabled:
 
-                            message = MIMEMultipart()
-                            message["From"] = sender_email
-                            message['To'] = receiver_email
-                            message['Subject'] = (
-                                f"PowerOffDelay - {self.nodename}"
+                            result = self.changeCrontab(match.group(0))
+
+                        else:
+                            if self.verbose_logging:
+                                logging.info(
+                                    f"PowerOffDelay - Service "
+                                    f"is disabled by "
+                                    f"{match.group(0)}"
+                                )
+                            self.writeLog(
+                                False,
+                                f"PowerOffDelay - Service is disabled by "
+                                f"{match.group(0)}\n"
                             )
 
-                            if self.enabled:
-                                if result == 0:
-                                    body = (
-                                        f"Hi Hacker,\n\n De node"
-                                        f" {self.nodename} blijft 2 uur extra "
-                                        f"aan.\n\nDeze opdracht komt van "
-                                        f"{match.group(0)}.\n\n"
-                                        f"De eindtijd is nu "
-                                        f"{self.shutdowntime}\n\n"
+                        sender_email = self.mail_sender
+                        receiver_email = ", ".join(self.allowed_senders)
+
+                        message = EmailMessage()
+                        message["From"] = sender_email
+                        message['To'] = receiver_email
+                        message['Subject'] = (
+                            f"PowerOffDelay - {self.nodename}"
+                        )
+
+                        if self.enabled:
+                            if result == 0:
+                                body = [
+                                    f"Hi Hacker,\n\n De node"
+                                    f" {self.nodename} blijft 2 uur extra "
+                                    f"aan.\n\nDeze opdracht komt van "
+                                    f"{match.group(0)}.\n\n"
+                                    f"De eindtijd is nu "
+                                    f"{self.shutdowntime}\n\n"
+                                ]
+
+                                if self.shutdowntime != \
+                                        self.maxshutdowntime:
+                                    body.append(
+                                        f"Als de eerst tijd is gepasseerd,"
+                                        f" is de volgende eindtijd "
+                                        f"{self.maxshutdowntime}\n\n"
                                     )
 
-                                    if self.shutdowntime != \
-                                            self.maxshutdowntime:
-                                        body = (
-                                            f"{body}"
-                                            f"Als de eerst tijd is gepasseerd,"
-                                            f" is de volgende eindtijd "
-                                            f"{self.maxshutdowntime}\n\n"
-                                        )
-
-                                    body = (
-                                        f"{body}"
-                                        f"Fijne dag!\n\n"
-                                    )
+                                body.append("Fijne dag!\n\n")
+                                body = "".join(body)
 
-                                else:
-                                    body = (
-                                        f"Hi Hacker,\n\n De node "
-                                        f"{self.nodename} staat nu uit.\n"
-                                        f"Je kunt de tijd nu niet verhogen\n\n"
-                                        f"Deze opdracht komt van "
-                                        f"{match.group(0)}.\n\n"
-                                        f"Fijne dag!\n\n"
-                                    )
                             else:
                                 body = (
-                                    f"Hi Hacker,\n\nDe service "
-                                    f"staat uit om {self.nodename} aan te "
-                                    f"kunnen zetten.\nJe hoeft en kunt nu dus "
-                                    f"even geen commando's geven.\n\n"
+                                    f"Hi Hacker,\n\n De node "
+                                    f"{self.nodename} staat nu uit.\n"
+                                    f"Je kunt de tijd nu niet verhogen\n\n"
                                     f"Deze opdracht komt van "
                                     f"{match.group(0)}.\n\n"
                                     f"Fijne dag!\n\n"
                                 )
+                        else:
+                            body = (
+                                f"Hi Hacker,\n\nDe service "
+                                f"staat uit om {self.nodename} aan te "
+                                f"kunnen zetten.\nJe hoeft en kunt nu dus "
+                                f"even geen commando's geven.\n\n"
+                                f"Deze opdracht komt van "
+                                f"{match.group(0)}.\n\n"
+                                f"Fijne dag!\n\n"
+                            )
 
-                            plain_text = MIMEText(
-                                body, _subtype='plain', _charset='UTF-8')
-                            message.attach(plain_text)
-
-                            my_message = message.as_string()
-
-                            try:
-                                email_session = smtplib.SMTP(
-                                    self.mail_server, self.mail_port)
-                                email_session.starttls()
-                                email_session.login(
-                                    self.mail_login, self.mail_password)
-                                email_session.sendmail(
-                                    sender_email,
-                                    self.allowed_senders,
-                                    my_message
-                                )
-                                email_session.quit()
-
-                                if self.verbose_logging:
-                                    logging.info(
-                                        f"PowerOffDelay - Mail Sent to "
-                                        f"{receiver_email}."
-                                    )
-
-                                self.writeLog(
-                                    False,
-                                    f"PowerOffDelay - Mail Sent to "
-                                    f"{receiver_email}.\n"
-                                )
+                        # a single text/plain part, no multipart wrapper
+                        message.set_content(body, charset='UTF-8')
 
-                            except (gaierror, ConnectionRefusedError):
-                                logging.error(
-                                    "Failed to connect to the server. "
-                                    "Bad connection settings?")
-                            except smtplib.SMTPServerDisconnected:
-                                logging.error(
-                                    "Failed to connect to the server. "
-                                    "Wrong user/password?"
-                                )
-                            except smtplib.SMTPException as e:
-                                logging.error(
-                                    f"SMTP error occurred: {str(e)}.")
+                        try:
+                            # send_message writes CRLF line endings
+                            email_session = self.mail_session()
+                            email_session.send_message(
+                                message,
+                                sender_email,
+                                self.allowed_senders
+                            )
 
-                        else:
                             if self.verbose_logging:
                                 logging.info(
-                                    f"PowerOffDelay - sender not in"
-                                    f" list {match.group(0)}."
+                                    f"PowerOffDelay - Mail Sent to "
+                                    f"{receiver_email}."
                                 )
+
                             self.writeLog(
                                 False,
-                                f"PowerOffDelay - sender not in list "
-                                f"{match.group(0)}.\n"
+                                f"PowerOffDelay - Mail Sent to "
+                                f"{receiver_email}.\n"
                             )
 
-                        if self.verbose_logging:
-                            logging.info(
-                                "PowerOffDelay - Marking message for delete.")
-                        self.writeLog(
-                            False, "PowerOffDelay - "
-                            "Marking message for delete.\n")
-
-                        if not self.dry_run:
-                            imap.store(str(i), "+FLAGS", "\\Deleted")
+                        except (gaierror, ConnectionRefusedError):
+                            logging.error(
+                                "Failed to connect to the server. "
+                                "Bad connection settings?")
+                        except smtplib.SMTPServerDisconnected:
+                            logging.error(
+                                "Failed to connect to the server. "
+                                "Wrong user/password?"
+                            )
+                        except smtplib.SMTPException as e:
+                            logging.error(
+                                f"SMTP error occurred: {str(e)}.")
 
                     else:
                         if self.verbose_logging:
                             logging.info(
-                                f"PowerOffDelay - Subject not recognized. "
-                                f"Skipping message. "
-                                f"{match.group(0)}"
+                                f"PowerOffDelay - sender not in"
+                                f" list {match.group(0)}."
                             )
+                        self.writeLog(
+                            False,
+                            f"PowerOffDelay - sender not in list "
+                            f"{match.group(0)}.\n"
+                        )
+
+                    if self.verbose_logging:
+                        logging.info(
+                            "PowerOffDelay - Marking message for delete.")
+                    self.writeLog(
+                        False, "PowerOffDelay - "
+                        "Marking message for delete.\n")
+
+                    to_delete.append(str(i))
+
+                else:
+                    if self.verbose_logging:
+                        logging.info(
+                            f"PowerOffDelay - Subject not recognized. "
+                            f"Skipping message. "
+                            f"{match.group(0)}"
+                        )
 
-                            self.writeLog(
-                                False,
-                                f"PowerOffDelay - Subject not recognized. "
-                                f"Skipping message. {match.group(0)}\n"
-                            )
+                        self.writeLog(
+                            False,
+                            f"PowerOffDelay - Subject not recognized. "
+                            f"Skipping message. {match.group(0)}\n"
+                        )
+
+        # flag all handled emails for delete in one go
+        if to_delete and not self.dry_run:
+            imap.store(",".join(to_delete), "+FLAGS", "\\Deleted")
+
+        # install all delays of this run at once
+        if self.crontab_changed:
+            self.installCrontab(self.crontab)
 
-        # close the connection and logout
         imap.expunge()
-        imap.close()
-        imap.logout()
+
+        self.end_mail_session()
 
 
 if __name__ == '__main__':
 
     poweroffdelay = POD()
-    poweroffdelay.run()
+    if "--idle" in sys.argv[1:]:
+        poweroffdelay.idle()
+    else:
+        poweroffdelay.run()
     poweroffdelay = None
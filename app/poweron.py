@@ -3,15 +3,15 @@
 # date: 2023-12-28 17:15:00
 # update: 2023-12-28 17:15:00
 
+import atexit
+import functools
 import logging
 import sys
 import configparser
 import shutil
-import socket
 
 from datetime import datetime
-from wakeonlan import send_magic_packet
-from chump import Application
+import common
 
 
 class POWERON():
@@ -32,52 +32,8 @@ class POWERON():
         self.config_filePath = f"{config_dir}{self.config_file}"
         self.log_filePath = f"{log_dir}{self.log_file}"
 
-        try:
-            with open(self.config_filePath, "r") as f:
-                f.close()
-            try:
-                self.config = configparser.ConfigParser()
-                self.config.read(self.config_filePath)
-
-                # GENERAL
-                self.enabled = True if (
-                    self.config['GENERAL']['ENABLED'] == "ON") else False
-                self.dry_run = True if (
-                    self.config['GENERAL']['DRY_RUN'] == "ON") else False
-                self.verbose_logging = True if (
-                    self.config['GENERAL']['VERBOSE_LOGGING'] == "ON") \
-                    else False
-
-                # NODE
-                self.nodename = self.config['NODE']['NODE_NAME']
-                self.macaddress = self.config['NODE']['NODE_MAC']\
-                    .replace(":", "-").lower()
-                self.nodeip = self.config['NODE']['NODE_IP']
-                self.nodeport = int(self.config['NODE']['NODE_PORT'])
-
-                # PUSHOVER
-                self.pushover_user_key = self.config['PUSHOVER']['USER_KEY']
-                self.pushover_token_api = self.config['PUSHOVER']['TOKEN_API']
-                self.pushover_sound = self.config['PUSHOVER']['SOUND']
-
-            except KeyError as e:
-                logging.error(
-                    f"Seems a key(s) {e} is missing from INI file. "
-                    f"Please check for mistakes. Exiting."
-                )
-
-                sys.exit()
-
-            except ValueError as e:
-                logging.error(
-                    f"Seems a invalid value in INI file. "
-                    f"Please check for mistakes. Exiting. "
-                    f"MSG: {e}"
-                )
-
-                sys.exit()
-
-        except IOError or FileNotFoundError:
+        self.config = configparser.ConfigParser()
+        if not self.config.read(self.config_filePath):
             logging.error(
                 f"Can't open file {self.config_filePath}"
                 f", creating example INI file."
@@ -87,24 +43,83 @@ class POWERON():
                             f'{config_dir}{self.exampleconfigfile}')
             sys.exit()
 
+        try:
+            # GENERAL
+            self.enabled = True if (
+                self.config['GENERAL']['ENABLED'] == "ON") else False
+            self.dry_run = True if (
+                self.config['GENERAL']['DRY_RUN'] == "ON") else False
+            self.verbose_logging = True if (
+                self.config['GENERAL']['VERBOSE_LOGGING'] == "ON") \
+                else False
+
+            # NODE
+            self.nodename = self.config['NODE']['NODE_NAME']
+            self.macaddress = self.config['NODE']['NODE_MAC']\
+                .replace(":", "-").lower()
+            self.nodeip = self.config['NODE']['NODE_IP']
+            self.nodeport = int(self.config['NODE']['NODE_PORT'])
+
+            # WOL packet, built once so a bad MAC fails here
+            self.magicpacket = common.magic_packet(self.macaddress)
+
+            # PUSHOVER
+            self.pushover_user_key = self.config['PUSHOVER']['USER_KEY']
+            self.pushover_token_api = self.config['PUSHOVER']['TOKEN_API']
+            self.pushover_sound = self.config['PUSHOVER']['SOUND']
+
+        except KeyError as e:
+            logging.error(
+                f"Seems a key(s) {e} is missing from INI file. "
+                f"Please check for mistakes. Exiting."
+            )
+
+            sys.exit()
+
+        except ValueError as e:
+            logging.error(
+                f"Seems a invalid value in INI file. "
+                f"Please check for mistakes. Exiting. "
+                f"MSG: {e}"
+            )
+
+            sys.exit()
+
+        # Keep the log open for the whole run, line buffered
+        try:
+            self.logfile = open(self.log_filePath, "a", buffering=1)
+            atexit.register(self.logfile.close)
+        except IOError:
+            self.logfile = None
+            logging.error(
+                f"Can't write file {self.log_filePath}."
+            )
+
     def writeLog(self, init, msg):
+        if self.logfile is None:
+            return
         try:
             if init:
-                logfile = open(self.log_filePath, "w")
-            else:
-                logfile = open(self.log_filePath, "a")
-            logfile.write(f"{datetime.now()} - {msg}")
-            logfile.close()
+                self.logfile.truncate(0)
+            self.logfile.write(f"{datetime.now()} - {msg}")
         except IOError:
             logging.error(
                 f"Can't write file {self.log_filePath}."
             )
 
-    def run(self):
-        # Setting for PushOver
-        self.appPushover = Application(self.pushover_token_api)
-        self.userPushover = self.appPushover.get_user(self.pushover_user_key)
+    def emit(self, msg, always=False):
+        # Format once, write to the console (when verbose) and the log file
+        if always or self.verbose_logging:
+            logging.info(msg)
+        self.writeLog(False, f"{msg}\n")
 
+    @functools.cached_property
+    def userPushover(self):
+        # Setting for PushOver, only once a message is actually sent
+        return common.pushover_user(
+            self.pushover_token_api, self.pushover_user_key)
+
+    def run(self):
         if self.dry_run:
             logging.info(
                 "*****************************************")
@@ -119,54 +134,26 @@ class POWERON():
             )
 
         if self.enabled:
-            sock = socket.socket(
-                socket.AF_INET, socket.SOCK_STREAM)
-            result = sock.connect_ex(
-                (self.nodeip, self.nodeport))
-            if result != 0:
+            if not common.is_port_open(self.nodeip, self.nodeport):
                 if not self.dry_run:
-                    try:
-                        send_magic_packet(self.macaddress)
+                    common.send_wol(self.magicpacket)
+
+                    self.emit(
+                        "PowerOn - Sending WOL command by cron",
+                        always=True)
 
-                        logging.info(
-                            "PowerOn - Sending WOL command by cron"
+                    self.message = \
+                        self.userPushover.send_message(
+                            message="PowerOn - "
+                            "WOL command sent by cron",
+                            sound=self.pushover_sound
                             )
-                        self.writeLog(
-                            False,
-                            "PowerOn - Sending WOL command by cron\n"
-                        )
-
-                        self.message = \
-                            self.userPushover.send_message(
-                                message="PowerOn - "
-                                "WOL command sent by cron",
-                                sound=self.pushover_sound
-                                )
-
-                    except ValueError:
-                        logging.error(
-                            "Invalid MAC-address in INI."
-                        )
-                        sys.exit()
 
             else:
-                logging.info(
-                    "PowerOn - Nodes already running"
-                    " by cron"
-                )
-                self.writeLog(
-                    False,
-                    "PowerOn - Nodes already running by cron\n"
-                )
+                self.emit(
+                    "PowerOn - Nodes already running by cron", always=True)
         else:
-            if self.verbose_logging:
-                logging.info(
-                    "PowerOn - Service is disabled by cron"
-                )
-            self.writeLog(
-                False,
-                "PowerOn - Service is disabled by cron\n"
-            )
+            self.emit("PowerOn - Service is disabled by cron")
 
 
 if __name__ == '__main__':
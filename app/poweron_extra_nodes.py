@@ -3,16 +3,15 @@
 # date: 2023-12-27 19:28:00
 # update: 2023-12-27 19:28:00
 
+import atexit
+import functools
 import logging
 import sys
 import configparser
 import shutil
-import socket
-import subprocess
 
 from datetime import datetime
-from wakeonlan import send_magic_packet
-from chump import Application
+import common
 
 
 class EXTRA_NODES():
@@ -33,60 +32,8 @@ class EXTRA_NODES():
         self.config_filePath = f"{config_dir}{self.config_file}"
         self.log_filePath = f"{log_dir}{self.log_file}"
 
-        try:
-            with open(self.config_filePath, "r") as f:
-                f.close()
-            try:
-                self.config = configparser.ConfigParser()
-                self.config.read(self.config_filePath)
-
-                # GENERAL
-                self.enabled = True if (
-                    self.config['GENERAL']['ENABLED'] == "ON") else False
-                self.dry_run = True if (
-                    self.config['GENERAL']['DRY_RUN'] == "ON") else False
-                self.verbose_logging = True if (
-                    self.config['GENERAL']['VERBOSE_LOGGING'] == "ON") \
-                    else False
-
-                # NODE
-                self.nodeip = self.config['NODE']['NODE_IP']
-                self.nodeport = int(self.config['NODE']['NODE_PORT'])
-
-                # EXTRANODES
-                self.nodename = list(
-                    self.config['EXTRANODES']
-                    ['NODE_NAME'].split(","))
-                self.extranodeip = list(
-                    self.config['EXTRANODES']
-                    ['NODE_IP'].split(","))
-                self.nodemacaddress = list(
-                    self.config['EXTRANODES']
-                    ['NODE_MAC_ADDRESS'].split(","))
-
-                # PUSHOVER
-                self.pushover_user_key = self.config['PUSHOVER']['USER_KEY']
-                self.pushover_token_api = self.config['PUSHOVER']['TOKEN_API']
-                self.pushover_sound = self.config['PUSHOVER']['SOUND']
-
-            except KeyError as e:
-                logging.error(
-                    f"Seems a key(s) {e} is missing from INI file. "
-                    f"Please check for mistakes. Exiting."
-                )
-
-                sys.exit()
-
-            except ValueError as e:
-                logging.error(
-                    f"Seems a invalid value in INI file. "
-                    f"Please check for mistakes. Exiting. "
-                    f"MSG: {e}"
-                )
-
-                sys.exit()
-
-        except IOError or FileNotFoundError:
+        self.config = configparser.ConfigParser()
+        if not self.config.read(self.config_filePath):
             logging.error(
                 f"Can't open file {self.config_filePath}"
                 f", creating example INI file."
@@ -96,32 +43,101 @@ class EXTRA_NODES():
                             f'{config_dir}{self.exampleconfigfile}')
             sys.exit()
 
+        try:
+            # GENERAL
+            self.enabled = True if (
+                self.config['GENERAL']['ENABLED'] == "ON") else False
+            self.dry_run = True if (
+                self.config['GENERAL']['DRY_RUN'] == "ON") else False
+            self.verbose_logging = True if (
+                self.config['GENERAL']['VERBOSE_LOGGING'] == "ON") \
+                else False
+
+            # Look up every section once, the keys are read from these
+            node = self.config['NODE']
+            extranodes = self.config['EXTRANODES']
+            pushover = self.config['PUSHOVER']
+
+            # NODE
+            self.nodeip = node['NODE_IP']
+            self.nodeport = int(node['NODE_PORT'])
+
+            # EXTRANODES, one entry per node, fixed after loading
+            self.nodename = tuple(
+                name.strip()
+                for name in extranodes['NODE_NAME'].split(","))
+            self.extranodeip = tuple(
+                ip.strip() for ip in extranodes['NODE_IP'].split(","))
+            self.nodemacaddress = tuple(
+                mac.strip()
+                for mac in extranodes['NODE_MAC_ADDRESS'].split(","))
+
+            # WOL packets, built once so a bad MAC fails here
+            self.magicpackets = [
+                common.magic_packet(mac) for mac in self.nodemacaddress]
+
+            # one record per extra node: name, IP, MAC and WOL packet
+            self.nodes = tuple(zip(
+                self.nodename, self.extranodeip,
+                self.nodemacaddress, self.magicpackets))
+
+            # PUSHOVER
+            self.pushover_user_key = pushover['USER_KEY']
+            self.pushover_token_api = pushover['TOKEN_API']
+            self.pushover_sound = pushover['SOUND']
+
+        except KeyError as e:
+            logging.error(
+                f"Seems a key(s) {e} is missing from INI file. "
+                f"Please check for mistakes. Exiting."
+            )
+
+            sys.exit()
+
+        except ValueError as e:
+            logging.error(
+                f"Seems a invalid value in INI file. "
+                f"Please check for mistakes. Exiting. "
+                f"MSG: {e}"
+            )
+
+            sys.exit()
+
+        # Keep the log open for the whole run, line buffered
+        try:
+            self.logfile = open(self.log_filePath, "a", buffering=1)
+            atexit.register(self.logfile.close)
+        except IOError:
+            self.logfile = None
+            logging.error(
+                f"Can't write file {self.log_filePath}."
+            )
+
     def writeLog(self, init, msg):
+        if self.logfile is None:
+            return
         try:
             if init:
-                logfile = open(self.log_filePath, "w")
-            else:
-                logfile = open(self.log_filePath, "a")
-            logfile.write(f"{datetime.now()} - {msg}")
-            logfile.close()
+                self.logfile.truncate(0)
+            self.logfile.write(f"{datetime.now()} - {msg}")
         except IOError:
             logging.error(
                 f"Can't write file {self.log_filePath}."
             )
 
-    def is_active_ip(self, ip_address):
-        command = ['ping', '-c', '1', ip_address]
-        try:
-            _ = subprocess.check_output(command)
-            return True
-        except subprocess.CalledProcessError:
-            return False
+    def emit(self, msg, always=False):
+        # Format once, write to the console (when verbose) and the log file
+        if always or self.verbose_logging:
+            logging.info(msg)
+        self.writeLog(False, f"{msg}\n")
 
-    def run(self):
-        # Setting for PushOver
-        self.appPushover = Application(self.pushover_token_api)
-        self.userPushover = self.appPushover.get_user(self.pushover_user_key)
+    @functools.cached_property
+    def userPushover(self):
+        # Setting for PushOver, only once a message is actually sent
+        return common.pushover_user(
+            self.pushover_token_api, self.pushover_user_key)
 
+    def run(self):
         if self.dry_run:
             logging.info(
                 "*****************************************")
@@ -136,52 +152,39 @@ class EXTRA_NODES():
             )
 
         if self.enabled:
-            sock = socket.socket(
-                socket.AF_INET, socket.SOCK_STREAM)
-            result = sock.connect_ex(
-                (self.nodeip, self.nodeport))
             # Port is open of the master node
-
-            if result == 0:
+            if common.is_port_open(self.nodeip, self.nodeport):
                 if not self.dry_run:
-                    numofnodes = len(self.nodename)
-
-                    for node in range(numofnodes):
-                        try:
-                            # is MAC is not active then send magic packet
-                            # if not self.check_mac_address(
-                            #        self.nodemacaddress[node].lower()):
-
-                            if not self.is_active_ip(self.extranodeip[node]):
-
-                                send_magic_packet(self.nodemacaddress[node])
-
-                                self.message = \
-                                    self.userPushover.send_message(
-                                        message=f"PowerOn Extra Nodes - "
-                                        f"WOL command sent for "
-                                        f"{self.nodename[node]} - "
-                                        f"{self.nodemacaddress[node]}\n",
-                                        sound=self.pushover_sound
-                                        )
-
-                                logging.info(
-                                    f"PowerOn - Sending WOL command for "
-                                    f"{self.nodename[node]} - "
-                                    f"{self.nodemacaddress[node]}"
-                                    )
-
-                                self.writeLog(
-                                    False,
-                                    f"PowerOn - Sending WOL command for "
-                                    f"{self.nodename[node]} - "
-                                    f"{self.nodemacaddress[node]}\n"
-                                    )
-
-                        except ValueError:
-                            logging.error(
-                                "Invalid MAC-address in INI."
-                            )
+                    activeips = common.active_ips(self.extranodeip)
+
+                    # is IP is not active then send magic packet,
+                    # all packets go out over one socket
+                    sleeping = [
+                        node for node in self.nodes
+                        if node[1] not in activeips
+                    ]
+
+                    if sleeping:
+                        common.send_wol(
+                            *(packet for _, _, _, packet in sleeping))
+
+                    notifications = []
+                    for name, _, mac, _ in sleeping:
+                        target = f"{name} - {mac}"
+
+                        notifications.append(
+                            f"PowerOn Extra Nodes - "
+                            f"WOL command sent for {target}")
+
+                        self.emit(
+                            f"PowerOn - Sending WOL command for {target}",
+                            always=True)
+
+                    # one Pushover message for all nodes of this run
+                    if notifications:
+                        self.message = common.send_pushover(
+                            self.userPushover, notifications,
+                            self.pushover_sound)
 
 
 if __name__ == '__main__':
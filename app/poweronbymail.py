@@ -3,26 +3,27 @@
 # date: 2023-01-04 20:08:00
 # update: 2023-12-28 12:47:00
 
+import atexit
+import functools
 import imaplib
-import email
+import email.parser
 import re
 import logging
+import os
 import sys
 import configparser
 import shutil
 import smtplib
-import socket
 import json
 
 from datetime import datetime, timedelta, time
-from email.header import decode_header
-from wakeonlan import send_magic_packet
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-# from email.mime.base import MIMEBase
-# from email import encoders
+from email.message import EmailMessage
 from socket import gaierror
-from chump import Application
+import common
+import imapidle
+
+_FROM_RE = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+_HEADER_PARSER = email.parser.BytesHeaderParser()
 
 
 class POBE():
@@ -42,101 +43,142 @@ class POBE():
         self.state_file = "poweron.json"
 
         self.config_filePath = f"{config_dir}{self.config_file}"
+        self.exampleconfig_filePath = f"{config_dir}{self.exampleconfigfile}"
+        self.exampleconfig_appPath = f"{app_dir}{self.exampleconfigfile}"
         self.state_filePath = f"{config_dir}{self.state_file}"
         self.log_filePath = f"{log_dir}{self.log_file}"
 
-        try:
-            with open(self.config_filePath, "r") as f:
-                f.close()
-            try:
-                self.config = configparser.ConfigParser()
-                self.config.read(self.config_filePath)
-
-                # GENERAL
-                self.enabled = True if (
-                    self.config['GENERAL']['ENABLED'] == "ON") else False
-                self.dry_run = True if (
-                    self.config['GENERAL']['DRY_RUN'] == "ON") else False
-                self.verbose_logging = True if (
-                    self.config['GENERAL']['VERBOSE_LOGGING'] == "ON") \
-                    else False
-
-                # NODE
-                self.nodename = self.config['NODE']['NODE_NAME']
-                self.macaddress = self.config['NODE']['NODE_MAC']\
-                    .replace(":", "-").lower()
-                self.nodeip = self.config['NODE']['NODE_IP']
-                self.nodeport = int(self.config['NODE']['NODE_PORT'])
-
-                # MAIL
-                self.mail_port = int(
-                    self.config['MAIL']['MAIL_PORT'])
-                self.mail_server = self.config['MAIL']['MAIL_SERVER']
-                self.mail_login = self.config['MAIL']['MAIL_LOGIN']
-                self.mail_password = self.config['MAIL']['MAIL_PASSWORD']
-                self.mail_sender = self.config['MAIL']['MAIL_SENDER']
-
-                # POWERON
-                self.keyword = self.config['POWERON']['KEYWORD']
-                self.allowed_senders = list(
-                    self.config['POWERON']['ALLOWED_SENDERS'].split(","))
-                self.allowed_credits = list(
-                    self.config['POWERON']['ALLOWED_CREDITS'].split(","))
-                self.credits = dict(
-                    zip(self.allowed_senders, self.allowed_credits)
-                    )
+        # SMTP session, opened on the first reply
+        self.smtp = None
 
-                # PUSHOVER
-                self.pushover_user_key = self.config['PUSHOVER']['USER_KEY']
-                self.pushover_token_api = self.config['PUSHOVER']['TOKEN_API']
-                self.pushover_sound = self.config['PUSHOVER']['SOUND']
+        # seconds to wait for the node to answer the port probe
+        self.probe_timeout = 2.0
 
-            except KeyError as e:
-                logging.error(
-                    f"Seems a key(s) {e} is missing from INI file. "
-                    f"Please check for mistakes. Exiting."
-                )
+        # times the magic packet is sent, some NICs miss the first one
+        self.wol_repeats = 5
 
-                sys.exit()
+        self.load_config()
+        self.load_state()
 
-            except ValueError as e:
-                logging.error(
-                    f"Seems a invalid value in INI file. "
-                    f"Please check for mistakes. Exiting. "
-                    f"MSG: {e}"
-                )
+        # Keep the log open and buffered, it is written out on exit
+        try:
+            self.logfile = open(self.log_filePath, "a", buffering=65536)
+            atexit.register(self.logfile.close)
+        except IOError:
+            self.logfile = None
+            logging.error(
+                f"Can't write file {self.log_filePath}."
+            )
 
-                sys.exit()
+    def load_config(self):
+        # Read the INI, --idle rereads it before every pass
+        self.config = configparser.ConfigParser()
+        if not self.config.read(self.config_filePath):
+            logging.error(
+                f"Can't open file {self.config_filePath}"
+                f", creating example INI file."
+            )
 
-            # Get state from jsonfile
-            try:
+            shutil.copyfile(self.exampleconfig_appPath,
+                            self.exampleconfig_filePath)
+            sys.exit()
 
-                # check if it is midnight on monday.
-                # if so, reset the counters, by not reading the state.
-                # State will be written at the end of the script woth
-                # the default values.
-                now = datetime.now()
-                current_date_time = now.strftime("%Y-%m-%d %H:%M:%S")
-                if self.get_first_day_of_week() != current_date_time:
-                    with open(self.state_filePath, 'r') as json_file:
-                        self.credits = json.load(json_file)
-
-            except IOError or FileNotFoundError:
-                logging.info(
-                    f"Can't open file {self.state_filePath}"
-                    f", using default values from ini."
+        try:
+            # Look up every section once, the keys are read from these
+            general = self.config['GENERAL']
+            node = self.config['NODE']
+            mail = self.config['MAIL']
+            poweron = self.config['POWERON']
+            pushover = self.config['PUSHOVER']
+
+            # GENERAL
+            self.enabled = True if (
+                general['ENABLED'] == "ON") else False
+            self.dry_run = True if (
+                general['DRY_RUN'] == "ON") else False
+            self.verbose_logging = True if (
+                general['VERBOSE_LOGGING'] == "ON") else False
+
+            # NODE
+            self.nodename = node['NODE_NAME']
+            self.macaddress = node['NODE_MAC'].replace(":", "-").lower()
+            self.nodeip = node['NODE_IP']
+            self.nodeport = int(node['NODE_PORT'])
+
+            # WOL packet, built once so a bad MAC fails here
+            self.magicpacket = common.magic_packet(self.macaddress)
+
+            # MAIL
+            self.mail_port = int(mail['MAIL_PORT'])
+            self.mail_server = mail['MAIL_SERVER']
+            self.mail_login = mail['MAIL_LOGIN']
+            self.mail_password = mail['MAIL_PASSWORD']
+            self.mail_sender = mail['MAIL_SENDER']
+
+            # POWERON
+            self.keyword = poweron['KEYWORD']
+            self.keyword_cf = self.keyword.casefold()
+            self.allowed_senders = list(
+                poweron['ALLOWED_SENDERS'].split(","))
+            # allowed senders by casefolded address, each mapped to
+            # the address as written, which keys the credits
+            self.allowed_accounts = {
+                address.strip().casefold(): address
+                for address in self.allowed_senders
+            }
+            self.allowed_credits = list(
+                poweron['ALLOWED_CREDITS'].split(","))
+            self.credits = dict(
+                zip(self.allowed_senders, self.allowed_credits)
                 )
 
-        except IOError or FileNotFoundError:
+            # PUSHOVER
+            self.pushover_user_key = pushover['USER_KEY']
+            self.pushover_token_api = pushover['TOKEN_API']
+            self.pushover_sound = pushover['SOUND']
+
+        except KeyError as e:
             logging.error(
-                f"Can't open file {self.config_filePath}"
-                f", creating example INI file."
+                f"Seems a key(s) {e} is missing from INI file. "
+                f"Please check for mistakes. Exiting."
+            )
+
+            sys.exit()
+
+        except ValueError as e:
+            logging.error(
+                f"Seems a invalid value in INI file. "
+                f"Please check for mistakes. Exiting. "
+                f"MSG: {e}"
             )
 
-            shutil.copyfile(f'{app_dir}{self.exampleconfigfile}',
-                            f'{config_dir}{self.exampleconfigfile}')
             sys.exit()
 
+    def load_state(self):
+        # Read the credits, --idle rereads them before every pass.
+        # Credits as last saved, None until read from the state file.
+        self.credits_saved = None
+
+        # Get state from jsonfile
+        try:
+
+            # check if it is midnight on monday.
+            # if so, reset the counters, by not reading the state.
+            # State will be written at the end of the script woth
+            # the default values.
+            now = datetime.now()
+            current_date_time = now.strftime("%Y-%m-%d %H:%M:%S")
+            if self.get_first_day_of_week() != current_date_time:
+                with open(self.state_filePath, 'r') as json_file:
+                    self.credits = json.load(json_file)
+                self.credits_saved = dict(self.credits)
+
+        except OSError:
+            logging.info(
+                f"Can't open file {self.state_filePath}"
+                f", using default values from ini."
+            )
+
     def get_first_day_of_week(self):
         today = datetime.today()
         first_day = today - timedelta(days=today.weekday())
@@ -145,23 +187,55 @@ class POBE():
         return first_day_midnight
 
     def writeLog(self, init, msg):
+        if self.logfile is None:
+            return
         try:
             if init:
-                logfile = open(self.log_filePath, "w")
-            else:
-                logfile = open(self.log_filePath, "a")
-            logfile.write(f"{datetime.now()} - {msg}")
-            logfile.close()
+                self.logfile.truncate(0)
+            self.logfile.write(f"{datetime.now()} - {msg}")
         except IOError:
             logging.error(
                 f"Can't write file {self.log_filePath}."
             )
 
-    def run(self):
-        # Setting for PushOver
-        self.appPushover = Application(self.pushover_token_api)
-        self.userPushover = self.appPushover.get_user(self.pushover_user_key)
-
+    def mail_session(self):
+        # Log in on the first reply of a pass and reuse the session for
+        # the rest of that pass
+        if self.smtp is not None:
+            try:
+                # a server that timed out the session answers 421
+                if self.smtp.noop()[0] == 250:
+                    return self.smtp
+            except smtplib.SMTPServerDisconnected:
+                pass
+            self.end_mail_session()
+
+        self.smtp = common.smtp_login(
+            self.mail_server, self.mail_port,
+            self.mail_login, self.mail_password)
+        return self.smtp
+
+    def end_mail_session(self):
+        # Quit after every pass, the server drops idle sessions anyway
+        if self.smtp is not None:
+            common.smtp_quit(self.smtp)
+            self.smtp = None
+
+    def is_port_open(self):
+        # Probe the node once per pass, later mails reuse the answer
+        if self.node_running is None:
+            self.node_running = common.is_port_open(
+                self.nodeip, self.nodeport, self.probe_timeout)
+
+        return self.node_running
+
+    @functools.cached_property
+    def userPushover(self):
+        # Setting for PushOver, only once a message is actually sent
+        return common.pushover_user(
+            self.pushover_token_api, self.pushover_user_key)
+
+    def connect(self):
         if self.dry_run:
             logging.info(
                 "*****************************************")
@@ -180,276 +254,287 @@ class POBE():
         # authenticate
         imap.login(self.mail_login, self.mail_password)
 
-        status, messages = imap.select("INBOX")
-
-        # total number of emails
-        messages = int(messages[0])
-
-        for i in range(1, messages+1):
-
-            # fetch the email message by ID
-            res, msg = imap.fetch(str(i), "(RFC822)")
-            for response in msg:
-                if isinstance(response, tuple):
-                    # parse a bytes email into a message object
-                    msg = email.message_from_bytes(response[1])
-
-                    # decode the email subject
-                    subject, encoding = decode_header(msg["Subject"])[0]
-
-                    if isinstance(subject, bytes):
-                        # if it's a bytes, decode to str
-                        if encoding:
-                            subject = subject.decode(encoding)
-                        else:
-                            subject = subject.decode("utf-8")
-
-                    # decode email sender
-                    From, encoding = decode_header(msg.get("From"))[-1:][0]
-
-                    if isinstance(From, bytes):
-                        if encoding:
-                            From = From.decode(encoding)
-                        else:
-                            From = From.decode("utf-8")
-
-                    match = re.search(r'[\w.+-]+@[\w-]+\.[\w.-]+', From)
-
-                    if str.lower(subject) == self.keyword.lower():
-
-                        if self.verbose_logging:
-                            logging.info(
-                                f"PowerOn - Found matching subject from "
-                                f"{match.group(0)}"
-                            )
-                        self.writeLog(
-                            False, f"PowerOn - Found matching subject from "
-                            f"{match.group(0)}\n")
-
-                        if match.group(0) in self.allowed_senders:
-
-                            if self.enabled:
-                                sock = socket.socket(
-                                    socket.AF_INET, socket.SOCK_STREAM)
-                                result = sock.connect_ex(
-                                    (self.nodeip, self.nodeport))
-
-                                if result != 0:
-                                    if not self.dry_run:
-                                        try:
-                                            if self.credits.get(
-                                                    match.group(0), 0) != 0:
-                                                send_magic_packet(
-                                                    self.macaddress)
-
-                                        except ValueError:
-                                            logging.error(
-                                                "Invalid MAC-address in INI."
-                                            )
-                                            sys.exit()
-
-                                    logging.info(
-                                        f"PowerOn - Sending WOL command by"
-                                        f" {match.group(0)}"
-                                        )
-                                    self.writeLog(
-                                        False,
-                                        f"PowerOn - Sending WOL command by"
-                                        f" {match.group(0)}\n"
-                                    )
-
-                                    self.message = \
-                                        self.userPushover.send_message(
-                                            message=f"PowerOnByEmail - "
-                                            f"WOL command sent by "
-                                            f"{match.group(0)}\n",
-                                            sound=self.pushover_sound
-                                            )
-
-                                else:
-                                    logging.info(
-                                        f"PowerOn - Nodes already running"
-                                        f" by {match.group(0)}"
-                                    )
-                                    self.writeLog(
-                                        False,
-                                        f"PowerOn - Nodes already running by "
-                                        f"{match.group(0)}\n"
-                                    )
-                            else:
-                                if self.verbose_logging:
-                                    logging.info(
-                                        f"PowerOn - Service is disabled by "
-                                        f"{match.group(0)}"
-                                    )
-                                self.writeLog(
-                                    False,
-                                    f"PowerOn - Service is disabled by "
-                                    f"{match.group(0)}\n"
-                                )
-
-                            sender_email = self.mail_sender
-                            receiver_email = match.group(0)
-
-                            message = MIMEMultipart()
-                            message["From"] = sender_email
-                            message['To'] = receiver_email
-                            message['Subject'] = (
-                                f"PowerOn - {self.nodename}"
-                            )
-
-                            # attachment = open(self.log_filePath, 'rb')
-                            # obj = MIMEBase('application', 'octet-stream')
-                            # obj.set_payload((attachment).read())
-                            # encoders.encode_base64(obj)
-                            # obj.add_header(
-                            #     'Content-Disposition',
-                            #     "attachment; filename= "+self.log_file
-                            # )
-                            # message.attach(obj)
-
-                            if self.enabled:
-                                if result != 0:
-
-                                    # Get the credits for the is user
-                                    # Check is it's not ZERO
-                                    # (so users with credits ">0" or "-1")
-                                    credit = int(self.credits[match.group(0)])
-                                    if credit != 0:
-                                        # If credits greater than 0 do a "-1"
-                                        if credit > 0:
-                                            credit -= 1
-                                            self.credits[match.group(0)] = \
-                                                str(credit)
-
-                                        body = (
-                                            f"Hi,\n\n {self.nodename} "
-                                            f"wordt aangezet, "
-                                            f"even geduld.\n\n")
-
-                                        if credit > -1:
-                                            body += (
-                                                f"Er kan nog {credit} keer een"
-                                                f" verzoek gedaan worden deze"
-                                                f" week om {self.nodename} aan"
-                                                f" te zetten.\n\n")
-
-                                        body += "Fijne dag!\n\n"
-                                    else:
-                                        body = (
-                                            f"Hi,\n\n {self.nodename} "
-                                            f"wordt niet aangezet, "
-                                            f"je credits zijn op voor "
-                                            f"deze week.\n\nFijne dag!\n\n"
-                                        )
-                                else:
-                                    body = (
-                                        f"Hi,\n\n {self.nodename} is al aan, "
-                                        f"Je hoeft het 'power on' "
-                                        f"commando niet meer te sturen.\n\n"
-                                        f"Fijne dag!\n\n"
-                                    )
-                            else:
-                                body = (
-                                    f"Hi,\n\nDe service voor {self.nodename} "
-                                    f"staat uit, je hoeft even geen "
-                                    f"commando's te sturen.\n\n"
-                                    f"Fijne dag!\n\n"
-                                )
-
-                            # logfile = open(self.log_filePath, "r")
-                            # body += ''.join(logfile.readlines())
-                            # logfile.close()
-
-                            plain_text = MIMEText(
-                                body, _subtype='plain', _charset='UTF-8')
-                            message.attach(plain_text)
-
-                            my_message = message.as_string()
-
-                            try:
-                                email_session = smtplib.SMTP(
-                                    self.mail_server, self.mail_port)
-                                email_session.starttls()
-                                email_session.login(
-                                    self.mail_login, self.mail_password)
-                                email_session.sendmail(
-                                    sender_email,
-                                    [receiver_email],
-                                    my_message
-                                    )
-                                email_session.quit()
-                                if self.verbose_logging:
-                                    logging.info(
-                                        f"PowerOn - Mail Sent to "
-                                        f"{receiver_email}."
-                                    )
-
-                                self.writeLog(
-                                    False,
-                                    f"PowerOn - Mail Sent to "
-                                    f"{receiver_email}.\n"
-                                )
-
-                            except (gaierror, ConnectionRefusedError):
-                                logging.error(
-                                    "Failed to connect to the server. "
-                                    "Bad connection settings?")
-                            except smtplib.SMTPServerDisconnected:
-                                logging.error(
-                                    "Failed to connect to the server. "
-                                    "Wrong user/password?"
-                                )
-                            except smtplib.SMTPException as e:
-                                logging.error(
-                                    f"SMTP error occurred: {str(e)}.")
-
-                        else:
-                            if self.verbose_logging:
-                                logging.info(
-                                    f"PowerOn - sender not in"
-                                    f" list {match.group(0)}."
-                                    )
-                            self.writeLog(
-                                False,
-                                f"PowerOn - sender not in list "
-                                f"{match.group(0)}.\n"
-                            )
-
-                        if self.verbose_logging:
-                            logging.info(
-                                "PowerOn - Marking message for delete.")
-                        self.writeLog(
-                            False, "PowerOn - Marking message for delete.\n")
-
-                        if not self.dry_run:
-                            imap.store(str(i), "+FLAGS", "\\Deleted")
-
-                    else:
-                        if self.verbose_logging:
-                            logging.info(
-                                f"PowerOn - Subject not recognized. "
-                                f"Skipping message. "
-                                f"{match.group(0)}"
-                            )
-
-                            self.writeLog(
-                                False,
-                                f"PowerOn - Subject not recognized. "
-                                f"Skipping message. {match.group(0)}\n"
-                            )
+        return imap
+
+    def run(self):
+        imap = self.connect()
+
+        self.process_inbox(imap)
 
         # close the connection and logout
-        imap.expunge()
         imap.close()
         imap.logout()
 
-        # Save state to jsonfile
+    def idle(self):
+        # Keep one IMAP connection open and handle new mail as it arrives
+        imapidle.idle(
+            "PowerOn", self.connect, self.idle_pass, self.logfile)
+
+    def idle_pass(self, imap):
+        # A cron run starts from the INI and credits as they are on disk,
+        # pick up any change before handling new mail
+        self.load_config()
+        self.load_state()
+        self.process_inbox(imap)
+
+    def sender_address(self, msg):
+        # decode email sender
+        From = common.header_part(msg.get("From"), -1)
+
+        return _FROM_RE.search(From).group(0)
+
+    def process_inbox(self, imap):
+        # Node state, probed on the first matching mail of this pass
+        self.node_running = None
+
+        imap.select("INBOX")
+
+        # let the server look up the emails with the keyword in the subject
+        messages = common.search_subject(imap, self.keyword)
+
+        # fetch Subject and From of those emails in one go,
+        # leave the \Seen flag
+        data = []
+        if messages:
+            res, data = imap.fetch(
+                b",".join(messages),
+                "(BODY.PEEK[HEADER.FIELDS (SUBJECT FROM)])")
+
+        to_delete = []
+        for response in data:
+            if not isinstance(response, tuple):
+                continue
+
+            # message ID from the response, b'3 (BODY[HEADER...'
+            i = int(response[0].split()[0])
+
+            # parse the header bytes into a message object
+            msg = _HEADER_PARSER.parsebytes(response[1])
+
+            if self.process_message(msg):
+                if self.verbose_logging:
+                    logging.info(
+                        "PowerOn - Marking message for delete.")
+                self.writeLog(
+                    False, "PowerOn - Marking message for delete.\n")
+
+                to_delete.append(str(i))
+
+        # flag all handled emails for delete in one go
+        if to_delete and not self.dry_run:
+            imap.store(",".join(to_delete), "+FLAGS", "\\Deleted")
+
+        imap.expunge()
+
+        # Save state to jsonfile when a credit changed or none was read
+        if self.credits != self.credits_saved:
+            self.saveState()
+
+        self.end_mail_session()
+
+    def process_message(self, msg):
+        # Handle one mail, returns True when it is done with and can be
+        # deleted
+
+        # decode the email subject
+        subject = common.header_part(msg["Subject"], 0)
+
+        # the sender is only looked at once the subject matched
+        if subject.casefold() != self.keyword_cf:
+            if self.verbose_logging:
+                sender = self.sender_address(msg)
+                logging.info(
+                    f"PowerOn - Subject not recognized. "
+                    f"Skipping message. "
+                    f"{sender}"
+                )
+
+                self.writeLog(
+                    False,
+                    f"PowerOn - Subject not recognized. "
+                    f"Skipping message. {sender}\n"
+                )
+            return False
+
+        sender = self.sender_address(msg)
+        account = self.allowed_accounts.get(sender.casefold())
+
+        if self.verbose_logging:
+            logging.info(
+                f"PowerOn - Found matching subject from "
+                f"{sender}"
+            )
+        self.writeLog(
+            False, f"PowerOn - Found matching subject from "
+            f"{sender}\n")
+
+        if account is None:
+            if self.verbose_logging:
+                logging.info(
+                    f"PowerOn - sender not in"
+                    f" list {sender}."
+                    )
+            self.writeLog(
+                False,
+                f"PowerOn - sender not in list "
+                f"{sender}.\n"
+            )
+            return True
+
+        if not self.enabled:
+            if self.verbose_logging:
+                logging.info(
+                    f"PowerOn - Service is disabled by "
+                    f"{sender}"
+                )
+            self.writeLog(
+                False,
+                f"PowerOn - Service is disabled by "
+                f"{sender}\n"
+            )
+
+            body = (
+                f"Hi,\n\nDe service voor {self.nodename} "
+                f"staat uit, je hoeft even geen "
+                f"commando's te sturen.\n\n"
+                f"Fijne dag!\n\n"
+            )
+
+        elif self.is_port_open():
+            logging.info(
+                f"PowerOn - Nodes already running"
+                f" by {sender}"
+            )
+            self.writeLog(
+                False,
+                f"PowerOn - Nodes already running by "
+                f"{sender}\n"
+            )
+
+            body = (
+                f"Hi,\n\n {self.nodename} is al aan, "
+                f"Je hoeft het 'power on' "
+                f"commando niet meer te sturen.\n\n"
+                f"Fijne dag!\n\n"
+            )
+
+        else:
+            if not self.dry_run:
+                if self.credits.get(account, 0) != 0:
+                    common.send_wol(*[self.magicpacket] * self.wol_repeats)
+
+            logging.info(
+                f"PowerOn - Sending WOL command by"
+                f" {sender}"
+                )
+            self.writeLog(
+                False,
+                f"PowerOn - Sending WOL command by"
+                f" {sender}\n"
+            )
+
+            self.message = \
+                self.userPushover.send_message(
+                    message=f"PowerOnByEmail - "
+                    f"WOL command sent by "
+                    f"{sender}\n",
+                    sound=self.pushover_sound
+                    )
+
+            body = self.useCredit(account)
+
+        self.send_reply(sender, body)
+
+        return True
+
+    def useCredit(self, account):
+        # Get the credits for the is user
+        # Check is it's not ZERO
+        # (so users with credits ">0" or "-1")
+        credit = int(self.credits[account])
+        if credit == 0:
+            return (
+                f"Hi,\n\n {self.nodename} "
+                f"wordt niet aangezet, "
+                f"je credits zijn op voor "
+                f"deze week.\n\nFijne dag!\n\n"
+            )
+
+        # If credits greater than 0 do a "-1"
+        if credit > 0:
+            credit -= 1
+            self.credits[account] = str(credit)
+
+        body = (
+            f"Hi,\n\n {self.nodename} "
+            f"wordt aangezet, "
+            f"even geduld.\n\n")
+
+        if credit > -1:
+            body += (
+                f"Er kan nog {credit} keer een"
+                f" verzoek gedaan worden deze"
+                f" week om {self.nodename} aan"
+                f" te zetten.\n\n")
+
+        return body + "Fijne dag!\n\n"
+
+    def send_reply(self, receiver_email, body):
+        sender_email = self.mail_sender
+
+        message = EmailMessage()
+        message["From"] = sender_email
+        message['To'] = receiver_email
+        message['Subject'] = (
+            f"PowerOn - {self.nodename}"
+        )
+        message.set_content(body, charset='UTF-8')
+
         try:
-            with open(self.state_filePath, 'w') as json_file:
+            # send_message writes CRLF line endings
+            email_session = self.mail_session()
+            email_session.send_message(
+                message,
+                sender_email,
+                [receiver_email]
+                )
+            if self.verbose_logging:
+                logging.info(
+                    f"PowerOn - Mail Sent to "
+                    f"{receiver_email}."
+                )
+
+            self.writeLog(
+                False,
+                f"PowerOn - Mail Sent to "
+                f"{receiver_email}.\n"
+            )
+
+        except (gaierror, ConnectionRefusedError):
+            logging.error(
+                "Failed to connect to the server. "
+                "Bad connection settings?")
+        except smtplib.SMTPServerDisconnected:
+            logging.error(
+                "Failed to connect to the server. "
+                "Wrong user/password?"
+            )
+        except smtplib.SMTPException as e:
+            logging.error(
+                f"SMTP error occurred: {str(e)}.")
+
+    def saveState(self):
+        try:
+            # write next to the state file and swap it in, so a crash
+            # never leaves half written credits
+            tmp_file = f"{self.state_filePath}.tmp"
+            with open(tmp_file, 'w') as json_file:
                 json.dump(self.credits, json_file)
+            os.replace(tmp_file, self.state_filePath)
+
+            self.credits_saved = dict(self.credits)
 
-        except IOError or FileNotFoundError:
+        except OSError:
             logging.error(
                 f"Can't save file {self.state_filePath}."
             )
@@ -458,5 +543,8 @@ class POBE():
 if __name__ == '__main__':
 
     poweronbyemail = POBE()
-    poweronbyemail.run()
+    if "--idle" in sys.argv[1:]:
+        poweronbyemail.idle()
+    else:
+        poweronbyemail.run()
     poweronbyemail = None
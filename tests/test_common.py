@@ -0,0 +1,136 @@
+import email.parser
+import os
+import sys
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import common  # noqa: E402
+
+PARSER = email.parser.BytesHeaderParser()
+
+
+def header(raw, name):
+    return PARSER.parsebytes(raw + b"\r\n\r\n")[name]
+
+
+class HeaderPartTest(unittest.TestCase):
+
+    def test_plain_header(self):
+        self.assertEqual(
+            common.header_part(header(b"Subject: PowerOn", "Subject"), 0),
+            "PowerOn")
+
+    def test_missing_header(self):
+        self.assertEqual(common.header_part(None, 0), "")
+
+    def test_encoded_word(self):
+        value = header(b"Subject: =?utf-8?q?Aanzetten_=C3=BC?=", "Subject")
+        self.assertEqual(common.header_part(value, 0), "Aanzetten ü")
+
+    def test_encoded_name_before_the_address(self):
+        value = header(
+            b"From: =?iso-8859-1?q?J=F6rg?= <jorg@example.com>", "From")
+        self.assertEqual(common.header_part(value, -1), " <jorg@example.com>")
+
+    def test_raw_8bit_header(self):
+        value = header(b"From: J\xc3\xb6rg <jorg@example.com>", "From")
+        self.assertEqual(
+            common.header_part(value, -1), "Jörg <jorg@example.com>")
+
+    def test_raw_8bit_header_that_is_not_utf8(self):
+        value = header(b"Subject: J\xf6rg", "Subject")
+        self.assertEqual(common.header_part(value, 0), "J�rg")
+
+    def test_unknown_charset(self):
+        value = header(b"Subject: =?x-nope?q?PowerOn?=", "Subject")
+        self.assertEqual(common.header_part(value, 0), "PowerOn")
+
+
+class MagicPacketTest(unittest.TestCase):
+
+    def test_separators(self):
+        packet = b"\xff" * 6 + bytes.fromhex("0011223344aa") * 16
+        for mac in ("00:11:22:33:44:AA", "00-11-22-33-44-aa",
+                    "0011.2233.44aa", " 00:11:22:33:44:aa\n"):
+            self.assertEqual(common.magic_packet(mac), packet)
+
+    def test_bad_mac(self):
+        with self.assertRaises(ValueError):
+            common.magic_packet("00:11:22:33:44")
+
+
+class FakeSearch:
+
+    def __init__(self, utf8=True):
+        self.utf8 = utf8
+        self.literal = None
+        self.calls = []
+
+    def search(self, charset, *criteria):
+        self.calls.append((charset, criteria, self.literal))
+        if charset == "UTF-8" and not self.utf8:
+            return "NO", [b"[BADCHARSET]"]
+        return "OK", [b"1 2"]
+
+
+class SearchSubjectTest(unittest.TestCase):
+
+    def test_ascii_keyword_is_quoted(self):
+        imap = FakeSearch()
+        self.assertEqual(
+            common.search_subject(imap, 'power "on" \\ now'), [b"1", b"2"])
+        self.assertEqual(
+            imap.calls,
+            [(None, ("SUBJECT", '"power \\"on\\" \\\\ now"'), None)])
+
+    def test_other_keyword_is_a_utf8_literal(self):
+        imap = FakeSearch()
+        common.search_subject(imap, "aanzetten ü")
+        self.assertEqual(
+            imap.calls,
+            [("UTF-8", ("SUBJECT",), "aanzetten ü".encode())])
+
+    def test_server_without_utf8_search(self):
+        imap = FakeSearch(utf8=False)
+        self.assertEqual(
+            common.search_subject(imap, "aanzetten ü"), [b"1", b"2"])
+        self.assertEqual(imap.calls[-1][:2], (None, ("ALL",)))
+
+
+class FakeUser:
+
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, message, sound):
+        if not 0 < len(message) <= 1024:
+            raise ValueError("Bad message: must be 0-1024 characters")
+        self.messages.append(message)
+        return message
+
+
+class SendPushoverTest(unittest.TestCase):
+
+    def test_lines_in_one_message(self):
+        user = FakeUser()
+        common.send_pushover(user, ["one", "two"], "pushover")
+        self.assertEqual(user.messages, ["one\ntwo\n"])
+
+    def test_long_batch_is_split(self):
+        user = FakeUser()
+        lines = [f"SLEEP command sent by user{n}@example.com"
+                 for n in range(100)]
+        common.send_pushover(user, lines, "pushover")
+        self.assertGreater(len(user.messages), 1)
+        self.assertEqual("".join(user.messages).splitlines(), lines)
+
+    def test_long_line_is_cut(self):
+        user = FakeUser()
+        common.send_pushover(user, ["x" * 2000], "pushover")
+        self.assertEqual(user.messages, ["x" * 1023 + "\n"])
+
+
+if __name__ == '__main__':
+    unittest.main()
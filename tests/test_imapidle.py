@@ -0,0 +1,121 @@
+import imaplib
+import os
+import socket
+import sys
+import threading
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import imapidle  # noqa: E402
+
+
+class FakeServer(threading.Thread):
+    # Just enough of an IMAP server for one client. idle_reply is what
+    # the server sends after "IDLE", None closes the connection.
+
+    def __init__(self, idle_reply):
+        super().__init__(daemon=True)
+        self.idle_reply = idle_reply
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        self.start()
+
+    def run(self):
+        conn, _ = self.listener.accept()
+        self.listener.close()
+        with conn, conn.makefile("rb") as lines:
+            conn.sendall(b"* OK fake server ready\r\n")
+            idle_tag = None
+            for line in lines:
+                if line.strip() == b"DONE":
+                    conn.sendall(idle_tag + b" OK IDLE terminated\r\n")
+                    continue
+
+                tag, command = line.split()[:2]
+                if command == b"CAPABILITY":
+                    conn.sendall(
+                        b"* CAPABILITY IMAP4rev1 IDLE\r\n"
+                        + tag + b" OK done\r\n")
+                elif command == b"IDLE":
+                    if self.idle_reply is None:
+                        return
+                    idle_tag = tag
+                    conn.sendall(self.idle_reply.replace(b"TAG", tag))
+                else:
+                    conn.sendall(tag + b" OK done\r\n")
+
+
+def client(idle_reply):
+    server = FakeServer(idle_reply)
+    imap = imaplib.IMAP4("127.0.0.1", server.port)
+    imap.sock.settimeout(5)
+    return imap
+
+
+class WaitForMailTest(unittest.TestCase):
+
+    def test_returns_on_new_mail(self):
+        imap = client(b"+ idling\r\n* 3 EXISTS\r\n")
+        imapidle.wait_for_mail(imap, timeout=5)
+        self.assertEqual(imap.noop()[0], "OK")
+
+    def test_other_untagged_lines_are_skipped(self):
+        imap = client(b"+ idling\r\n* 2 EXPUNGE\r\n* 3 EXISTS\r\n")
+        imapidle.wait_for_mail(imap, timeout=5)
+        self.assertEqual(imap.noop()[0], "OK")
+
+    def test_timeout_leaves_a_usable_connection(self):
+        imap = client(b"+ idling\r\n")
+        imapidle.wait_for_mail(imap, timeout=0.2)
+        self.assertEqual(imap.sock.gettimeout(), 5)
+        self.assertEqual(imap.noop()[0], "OK")
+
+    def test_refused_idle(self):
+        imap = client(b"TAG NO IDLE not allowed\r\n")
+        with self.assertRaises(imaplib.IMAP4.error):
+            imapidle.wait_for_mail(imap, timeout=5)
+
+    def test_connection_closed(self):
+        imap = client(None)
+        with self.assertRaises(imaplib.IMAP4.abort):
+            imapidle.wait_for_mail(imap, timeout=5)
+
+
+class ReconnectTest(unittest.TestCase):
+
+    def test_retries_until_connected(self):
+        attempts = []
+
+        def connect():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OSError("refused")
+            return "imap"
+
+        delays = imapidle.RETRY_DELAYS
+        imapidle.RETRY_DELAYS = (0, 0, 0)
+        try:
+            with self.assertLogs(level="ERROR"):
+                self.assertEqual(imapidle.reconnect("Test", connect), "imap")
+        finally:
+            imapidle.RETRY_DELAYS = delays
+        self.assertEqual(len(attempts), 3)
+
+    def test_last_failure_is_raised(self):
+        def connect():
+            raise OSError("refused")
+
+        delays = imapidle.RETRY_DELAYS
+        imapidle.RETRY_DELAYS = (0, 0)
+        try:
+            with self.assertLogs(level="ERROR"), \
+                    self.assertRaises(OSError):
+                imapidle.reconnect("Test", connect)
+        finally:
+            imapidle.RETRY_DELAYS = delays
+
+
+if __name__ == '__main__':
+    unittest.main()
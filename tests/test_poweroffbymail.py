@@ -0,0 +1,47 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from poweroffbymail import reset_crontab  # noqa: E402
+
+
+def reset(content, fields="0 21,23"):
+    return reset_crontab(content, fields)
+
+
+class CronLineTest(unittest.TestCase):
+
+    def test_only_the_poweroff_line_changes(self):
+        self.assertEqual(
+            reset("30 22 * * * python3 /app/poweroff.py\n"),
+            "0 21,23 * * * python3 /app/poweroff.py\n")
+
+    def test_comment_line_above_is_kept(self):
+        self.assertEqual(
+            reset("# PowerOff\n30 22 * * * python3 /app/poweroff.py\n"),
+            "# PowerOff\n0 21,23 * * * python3 /app/poweroff.py\n")
+
+    def test_env_line_above_is_kept(self):
+        self.assertEqual(
+            reset("SHELL=/bin/sh\n30 22 * * * python3 /app/poweroff.py\n"),
+            "SHELL=/bin/sh\n0 21,23 * * * python3 /app/poweroff.py\n")
+
+    def test_other_entries_are_left_alone(self):
+        content = (
+            "*/5 * * * * python3 /app/poweronbymail.py\n"
+            "30 22 * * * python3 /app/poweroff.py\n")
+        self.assertEqual(
+            reset(content),
+            "*/5 * * * * python3 /app/poweronbymail.py\n"
+            "0 21,23 * * * python3 /app/poweroff.py\n")
+
+    def test_crontab_without_poweroff_line(self):
+        content = "*/5 * * * * python3 /app/poweronbymail.py\n"
+        self.assertEqual(reset(content), content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from poweroffdelaybymail import POD  # noqa: E402
+
+CRONTAB = (
+    "SHELL=/bin/sh\n"
+    "{} * * * python3 /app/poweroff.py\n"
+    "*/5 * * * * python3 /app/poweroffdelaybymail.py\n")
+
+
+def delay(maxhour="23", extendhours=2):
+    # a POD with only the settings bumpCrontab reads, no INI needed
+    pod = POD.__new__(POD)
+    pod.maxhour = maxhour
+    pod.maxhour_compare = 24 if maxhour in ["0", "00"] else int(maxhour)
+    pod.extendhours = extendhours
+    pod.poweroff_line = None
+    return pod
+
+
+class BumpCrontabTest(unittest.TestCase):
+
+    def test_first_hour_moves_by_the_extend_time(self):
+        pod = delay()
+        self.assertEqual(
+            pod.bumpCrontab(CRONTAB.format("0 19,23")),
+            CRONTAB.format("0 21,23"))
+        self.assertEqual(pod.shutdowntime, "21:00")
+
+    def test_bump_past_the_max_hour_keeps_the_max_hour(self):
+        pod = delay()
+        self.assertEqual(
+            pod.bumpCrontab(CRONTAB.format("30 21,23")),
+            CRONTAB.format("30 23"))
+        self.assertEqual(pod.shutdowntime, "23:30")
+
+    def test_midnight_max_hour_counts_as_24(self):
+        pod = delay(maxhour="00")
+        self.assertEqual(
+            pod.bumpCrontab(CRONTAB.format("0 21,00")),
+            CRONTAB.format("0 23,00"))
+        self.assertEqual(pod.shutdowntime, "23:00")
+
+    def test_repeated_bumps_track_the_line_length(self):
+        # the line grows from "9" to "11" and shrinks to "23", the
+        # lines after it must stay intact on every bump
+        pod = delay()
+        content = CRONTAB.format("0 9,23")
+        for hours in ("11,23", "13,23", "15,23", "17,23", "19,23",
+                      "21,23", "23"):
+            content = pod.bumpCrontab(content)
+            self.assertEqual(content, CRONTAB.format(f"0 {hours}"))
+
+    def test_crontab_without_poweroff_line(self):
+        content = "*/5 * * * * python3 /app/poweroffdelaybymail.py\n"
+        pod = delay()
+        self.assertEqual(pod.bumpCrontab(content), content)
+        self.assertEqual(pod.bumpCrontab(content), content)
+
+    def test_poweroff_line_without_newline(self):
+        pod = delay()
+        self.assertEqual(
+            pod.bumpCrontab("0 19,23 * * * python3 /app/poweroff.py"),
+            "0 21,23 * * * python3 /app/poweroff.py")
+
+
+if __name__ == '__main__':
+    unittest.main()